@@ -0,0 +1,484 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from ch_format import clickhouse_format_command
+from diff_engine import ENGINES, get_diff_engine
+from file_features import FileFeatures, classify_lines, is_hidden
+from format_cache import close_format_cache, format_sql_cached_many, get_format_cache
+from git_utils import (CommitInfoIndex, close_blob_readers, git_diff_blob_changes, read_files_at_branches,
+                       run_git_command)
+from profiling import PROFILER
+from report import iter_report
+from sql_tokens import tokens_equal
+
+# Ветки синтетического репозитория
+BENCH_BRANCH1 = "bench_base"
+BENCH_BRANCH2 = "bench_feature"
+
+# Заглушка clickhouse-format: разбивает документ на запросы по ';' и переносит строки по запятым.
+# Как clickhouse-format -n, ставит ';' после каждого запроса отдельной строкой и добавляет пустую строку.
+STUB_FORMATTER = """\
+import re
+import sys
+
+if "--version" in sys.argv:
+    print("clickhouse-format stub (bench.py)")
+    sys.exit(0)
+queries = []
+for query in sys.stdin.read().split(";"):
+    query = " ".join(query.split())
+    if query:
+        query = re.sub(r"\\s*,\\s*", ",\\n    ", query)
+        query = re.sub(r"\\s+(ENGINE|ORDER BY|ADD COLUMN)\\b", r"\\n\\1", query)
+        queries.append(query + "\\n;\\n\\n")
+sys.stdout.write("".join(queries))
+"""
+
+
+def synthetic_sql_lines(statements, rng, columns=40, drops=True):
+    """
+    Отформатированный (по строке на элемент) синтетический DDL в стиле clickhouse-format.
+
+    :param columns: Наибольшее число колонок в CREATE TABLE
+    :param drops: Добавлять ли DROP TABLE (иначе вместо них ALTER TABLE)
+    """
+    lines = []
+    for n in range(statements):
+        kind = rng.random()
+        if kind < 0.6:
+            lines.append(f"CREATE TABLE IF NOT EXISTS db.table_{n}")
+            lines.append("(")
+            for c in range(rng.randint(min(5, columns), columns)):
+                lines.append(f"    `col_{c}` {rng.choice(['UInt64', 'String', 'DateTime', 'Nullable(String)'])},")
+            lines.append(f"    `id_{n}` UInt64")
+            lines.append(")")
+            lines.append("ENGINE = MergeTree")
+            lines.append(f"ORDER BY id_{n};")
+        elif kind < 0.9 or not drops:
+            lines.append(f"ALTER TABLE db.table_{n}")
+            lines.append(f"    ADD COLUMN IF NOT EXISTS `extra_{n}` String;")
+        else:
+            lines.append(f"DROP TABLE IF EXISTS db.table_{n};")
+        lines.append("")
+    return lines
+
+
+def repetitive_sql_lines(statements):
+    """
+    Файл из одинаковых 4-строчных блоков: уникальных строк нет совсем (худший случай для patience diff).
+    """
+    block = ["INSERT INTO db.events", "SELECT *", "FROM db.events_buffer", "WHERE date = today();"]
+    return block * statements
+
+
+def lowercase_blocks(lines, change_rate, rng, block=4):
+    """
+    Копия, в которой примерно change_rate доля блоков переписана в нижнем регистре.
+    """
+    result = []
+    for start in range(0, len(lines), block):
+        part = lines[start:start + block]
+        result.extend(line.lower() for line in part) if rng.random() < change_rate else result.extend(part)
+    return result
+
+
+def mutate_lines(lines, change_rate, rng):
+    """
+    Копия со случайными заменами, вставками и удалениями примерно в change_rate доле строк.
+    """
+    result = []
+    for line in lines:
+        r = rng.random()
+        if r < change_rate / 3:
+            continue
+        if r < 2 * change_rate / 3:
+            result.append(line.replace("String", "LowCardinality(String)") if "String" in line else line + " -- changed")
+            continue
+        result.append(line)
+        if r < change_rate:
+            result.append(f"    `new_col_{rng.randint(0, 10 ** 6)}` UInt8,")
+    return result
+
+
+def change_columns(lines, change_rate, rng):
+    """
+    Копия с настоящими изменениями колонок: смена типа и новые колонки примерно в change_rate доле строк.
+    В отличие от mutate_lines не добавляет комментариев, которые после очистки SQL поглощают хвост документа.
+    """
+    result = []
+    changed = False
+    for line in lines:
+        r = rng.random()
+        if line.startswith("    `") and r < change_rate:
+            changed = True
+            if r < change_rate / 2:
+                result.append(line.replace("UInt64", "Int64") if "UInt64" in line else line.replace("String", "UUID"))
+                continue
+            result.append(f"    `new_col_{rng.randint(0, 10 ** 6)}` UInt8,")
+        result.append(line)
+    if not changed:
+        result.insert(0, f"ALTER TABLE db.changed ADD COLUMN IF NOT EXISTS `c_{rng.randint(0, 10 ** 6)}` String;")
+    return result
+
+
+def whitespace_only(lines, rng):
+    """
+    Копия, отличающаяся только пробелами и пустыми строками.
+    """
+    result = []
+    for line in lines:
+        if line.startswith("    "):
+            line = "  " + line.lstrip() if rng.random() < 0.5 else "\t" + line.lstrip()
+        result.append(line + " " * rng.randint(0, 2))
+        if not line.strip() and rng.random() < 0.5:
+            result.append("")
+    return result
+
+
+def make_synthetic_repo(path, files=200, statements=30, columns=20, identical=0.3, whitespace=0.2,
+                        drop=0.1, change_rate=0.05, commits=5, branch1_only=0.05, seed=0):
+    """
+    Создает локальный git-репозиторий с двумя разошедшимися ветками BENCH_BRANCH1 и BENCH_BRANCH2.
+    Доли файлов: identical - не меняются, whitespace - отличаются только пробелами,
+    drop - в BENCH_BRANCH2 добавлен DROP TABLE, остальные - настоящие изменения колонок.
+    В BENCH_BRANCH1 после разветвления добавляются файлы, которых нет в BENCH_BRANCH2.
+
+    :param statements: Среднее число инструкций в файле (от половины до полутора)
+    :param commits: Число коммитов, по которым распределены файлы в каждой ветке
+    :return: {категория: число файлов}
+    """
+    rng = random.Random(seed)
+    os.makedirs(path)
+    git = ["-c", "user.name=bench", "-c", "user.email=bench@localhost", "-c", "commit.gpgsign=false"]
+    run_git_command(["init", "-q", "-b", BENCH_BRANCH1], cwd=path)
+
+    def write(file_path, lines):
+        full_path = os.path.join(path, file_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def commit_in_groups(items, message):
+        # items: [(путь, строки)]; файлы распределяются по commits коммитам
+        groups = max(1, min(commits, len(items)))
+        for g in range(groups):
+            for file_path, lines in items[g::groups]:
+                write(file_path, lines)
+            run_git_command(git + ["add", "-A"], cwd=path)
+            run_git_command(git + ["commit", "-q", "--allow-empty", "-m", f"{message} {g + 1}/{groups}"], cwd=path)
+
+    base = []
+    for i in range(files):
+        n = max(1, int(statements * rng.uniform(0.5, 1.5)))
+        base.append((f"sql/dir_{i % 16:02d}/file_{i:05d}.sql", synthetic_sql_lines(n, rng, columns, drops=False)))
+    commit_in_groups(base, "base")
+    run_git_command(["branch", BENCH_BRANCH2], cwd=path)
+
+    extra = [(f"sql/branch1_only/file_{i:05d}.sql", synthetic_sql_lines(statements, rng, columns, drops=False))
+             for i in range(int(files * branch1_only))]
+    commit_in_groups(extra, "branch1 only")
+
+    run_git_command(["checkout", "-q", BENCH_BRANCH2], cwd=path)
+    categories = {"identical": 0, "whitespace": 0, "drop": 0, "changed": 0}
+    edits = []
+    for file_path, lines in base:
+        r = rng.random()
+        if r < identical:
+            categories["identical"] += 1
+        elif r < identical + whitespace:
+            categories["whitespace"] += 1
+            edits.append((file_path, whitespace_only(lines, rng)))
+        elif r < identical + whitespace + drop:
+            categories["drop"] += 1
+            k = rng.randrange(statements)
+            edits.append((file_path, lines + [f"DROP TABLE IF EXISTS db.table_{k};", ""]))
+        else:
+            categories["changed"] += 1
+            edits.append((file_path, change_columns(lines, change_rate, rng)))
+    commit_in_groups(edits, "feature")
+    run_git_command(["checkout", "-q", BENCH_BRANCH1], cwd=path)
+    return categories
+
+
+def install_stub_formatter(directory):
+    """
+    Кладет заглушку clickhouse-format в directory и добавляет его в начало PATH.
+
+    :return: Прежнее значение PATH
+    """
+    os.makedirs(directory, exist_ok=True)
+    script = os.path.join(directory, "clickhouse_format_stub.py")
+    with open(script, "w", encoding="utf-8") as f:
+        f.write(STUB_FORMATTER)
+    # На macOS вызывается "clickhouse format", на остальных системах "clickhouse-format"
+    for name in ("clickhouse-format", "clickhouse"):
+        launcher = os.path.join(directory, name)
+        with open(launcher, "w", encoding="utf-8") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(launcher, 0o755)
+    old_path = os.environ.get("PATH", "")
+    os.environ["PATH"] = directory + os.pathsep + old_path
+    return old_path
+
+
+def run_stage(stages, name, func):
+    """
+    Выполняет этап и записывает его время и число запусков git и clickhouse-format.
+    """
+    git_spawns, format_spawns = PROFILER.counter("git.spawn"), PROFILER.counter("format.spawn")
+    start = time.perf_counter()
+    result = func()
+    stages[name] = {
+        "seconds": time.perf_counter() - start,
+        "git_spawns": PROFILER.counter("git.spawn") - git_spawns,
+        "format_spawns": PROFILER.counter("format.spawn") - format_spawns,
+    }
+    return result
+
+
+def bench_stages(branch1, branch2, jobs=None):
+    """
+    Этапы обработки по отдельности в текущем репозитории: поиск кандидатов, чтение, коммиты,
+    сравнение по токенам, форматирование (с холодным и прогретым кэшем), дифф, фильтры
+    и весь отчет целиком (--report) с пустым кэшем форматирования.
+    """
+    stages = {}
+    changes = run_stage(stages, "discovery", lambda: [
+        c for c in git_diff_blob_changes(branch1, branch2) if c["blob2"] is not None])
+    paths = [c["path"] for c in changes]
+    contents = run_stage(stages, "reads", lambda: read_files_at_branches([branch1, branch2], paths))
+    contents1, contents2 = contents[branch1], contents[branch2]
+
+    def commit_info():
+        indexes = [CommitInfoIndex(branch, paths).start() for branch in (branch1, branch2)]
+        return [index.get(p) for index in indexes for p in paths]
+    run_stage(stages, "commit_info", commit_info)
+
+    equal = run_stage(stages, "token_precheck", lambda: {
+        p for p in paths if tokens_equal(contents1[p], contents2[p])})
+    to_format = [c for c in changes if c["path"] not in equal]
+    queries = [contents1[c["path"]] for c in to_format] + [contents2[c["path"]] for c in to_format]
+    blob_shas = ([c["blob1"] for c in to_format] +
+                 [c["blob2"] for c in to_format])
+    # Кэш форматирования лежит в .git репозитория: первый проход холодный, второй - из кэша.
+    # Кэш открывается заранее, чтобы запрос версии clickhouse-format не попал в замер
+    get_format_cache()
+    formatted = run_stage(stages, "format_cold", lambda: format_sql_cached_many(queries, blob_shas))
+    run_stage(stages, "format_warm", lambda: format_sql_cached_many(queries, blob_shas))
+
+    count = len(to_format)
+    results = run_stage(stages, "diff", lambda: [
+        classify_lines(formatted[i].splitlines(), formatted[count + i].splitlines()) for i in range(count)])
+
+    def classify():
+        features = [FileFeatures() for _ in equal] + results
+        return {
+            "hidden_same": sum(is_hidden(f, ["hide_same"]) for f in features),
+            "hidden_same_drop": sum(is_hidden(f, ["hide_same", "hide_drop"]) for f in features),
+            "has_drop": sum(f.has_drop for f in features),
+        }
+    filtered = run_stage(stages, "filter", classify)
+
+    close_format_cache()
+    cache_path = os.path.join(run_git_command(["rev-parse", "--absolute-git-dir"]), "ch_format_cache.sqlite")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+    records = run_stage(stages, "report_end_to_end", lambda: sum(1 for _ in iter_report(branch1, branch2, jobs)))
+    counts = {"candidates": len(paths), "token_equal": len(equal), "formatted_docs": len(queries),
+              "report_records": records}
+    counts.update(filtered)
+    return stages, counts
+
+
+def tool_revision():
+    # Коммит самого инструмента, чтобы сравнивать результаты между версиями
+    try:
+        return run_git_command(["rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)))
+    except Exception:
+        return None
+
+
+def bench_repo(config, jobs=None, stub_formatter=False, workdir=None, keep=False):
+    """
+    Генерирует синтетический репозиторий по config (аргументы make_synthetic_repo) и замеряет этапы.
+    Сеть не используется; если clickhouse-format не найден, подставляется заглушка.
+    """
+    root = workdir or tempfile.mkdtemp(prefix="git_utils_bench_")
+    repo = os.path.join(root, "repo")
+    use_stub = stub_formatter or shutil.which(clickhouse_format_command()[0]) is None
+    old_path = install_stub_formatter(os.path.join(root, "bin")) if use_stub else None
+    cwd = os.getcwd()
+    profiling_enabled = PROFILER.enabled
+    PROFILER.enable()
+    try:
+        start = time.perf_counter()
+        categories = make_synthetic_repo(repo, **config)
+        generate_seconds = time.perf_counter() - start
+        os.chdir(repo)
+        # Общие процессы и кэши не должны переходить из другого репозитория
+        close_blob_readers()
+        close_format_cache()
+        stages, counts = bench_stages(BENCH_BRANCH1, BENCH_BRANCH2, jobs)
+    finally:
+        close_blob_readers()
+        close_format_cache()
+        os.chdir(cwd)
+        PROFILER.enabled = profiling_enabled
+        if old_path is not None:
+            os.environ["PATH"] = old_path
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+    return {
+        "tool_revision": tool_revision(),
+        "python": sys.version.split()[0],
+        "formatter": "stub" if use_stub else "clickhouse-format",
+        "diff_engine": get_diff_engine().name,
+        "config": config,
+        "categories": categories,
+        "generate_seconds": generate_seconds,
+        "stages": stages,
+        "counts": counts,
+        "repo": repo if keep else None,
+    }
+
+
+def compare_stages(result, baseline):
+    """
+    :return: Строки "этап: было -> стало (xN)" относительно сохраненного результата bench.py repo
+    """
+    lines = []
+    for name, stage in result["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if old is None:
+            continue
+        ratio = stage["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        lines.append(f"{name:<18} {old['seconds'] * 1000:10.1f} -> {stage['seconds'] * 1000:10.1f} ms  x{ratio:.2f}")
+    return lines
+
+
+def time_call(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_diff(statements, change_rate, repeat, engines, seed=0, shape="unique"):
+    """
+    Время построения диффа (лучшее из repeat) для каждого движка на одной паре файлов.
+
+    :param shape: "unique" - DDL, где почти все строки уникальны; "repetitive" - повторяющиеся блоки,
+        часть которых во второй версии переписана в нижнем регистре
+    """
+    rng = random.Random(seed)
+    if shape == "repetitive":
+        lines1 = repetitive_sql_lines(statements)
+        lines2 = lowercase_blocks(lines1, max(change_rate, 0.5), rng)
+    else:
+        lines1 = synthetic_sql_lines(statements, rng)
+        lines2 = mutate_lines(lines1, change_rate, rng)
+    results = {"shape": shape, "lines1": len(lines1), "lines2": len(lines2), "change_rate": change_rate,
+               "engines": {}}
+    for name in engines:
+        engine = ENGINES[name]
+        results["engines"][name] = {
+            "diff_seconds": time_call(lambda: list(engine.diff_lines(lines1, lines2)), repeat),
+            "equal_seconds": time_call(lambda: engine.equal(lines1, list(lines1)), repeat),
+        }
+    return results
+
+
+def default_engines(shape):
+    return [name for name in ENGINES if shape == "unique" or name != "ndiff"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks for git merge helper tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+    diff = sub.add_parser("diff", help="Compare diff engines on large synthetic SQL files")
+    diff.add_argument("--statements", type=int, nargs="+", default=[100, 500, 2000])
+    diff.add_argument("--change-rate", type=float, default=0.02)
+    diff.add_argument("--repeat", type=int, default=3)
+    diff.add_argument("--engines", nargs="+", choices=list(ENGINES),
+                      help="Default: all engines; ndiff is skipped for the repetitive shape, "
+                           "where its intraline matching is roughly cubic")
+    diff.add_argument("--shapes", nargs="+", default=["unique", "repetitive"], choices=["unique", "repetitive"],
+                      help="unique: mostly unique DDL lines; repetitive: repeated blocks with no unique lines")
+    diff.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    repo = sub.add_parser("repo", help="Time each processing stage on a generated two-branch git repository")
+    repo.add_argument("--files", type=int, default=200, help="Number of SQL files")
+    repo.add_argument("--statements", type=int, default=30, help="Average number of statements per file")
+    repo.add_argument("--columns", type=int, default=20, help="Maximum columns per CREATE TABLE (statement size)")
+    repo.add_argument("--identical", type=float, default=0.3, help="Fraction of files left unchanged")
+    repo.add_argument("--whitespace", type=float, default=0.2, help="Fraction of whitespace-only changes")
+    repo.add_argument("--drop", type=float, default=0.1, help="Fraction of files gaining a DROP TABLE")
+    repo.add_argument("--change-rate", type=float, default=0.05,
+                      help="Share of column lines edited in genuinely changed files")
+    repo.add_argument("--commits", type=int, default=5, help="Commits per branch the files are spread over")
+    repo.add_argument("--seed", type=int, default=0)
+    repo.add_argument("--jobs", type=int, default=None, help="Workers for the end-to-end report stage")
+    repo.add_argument("--stub-formatter", action="store_true",
+                      help="Use the stub formatter even if clickhouse-format is installed")
+    repo.add_argument("--workdir", help="Directory for the generated repository (default: a temporary one)")
+    repo.add_argument("--keep", action="store_true", help="Do not delete the generated repository")
+    repo.add_argument("--output", help="Write results as JSON to this file")
+    repo.add_argument("--compare", metavar="BASELINE", help="Compare stage times with a saved --output file")
+    repo.add_argument("--json", action="store_true", help="Print results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "repo":
+        config = {"files": args.files, "statements": args.statements, "columns": args.columns,
+                  "identical": args.identical, "whitespace": args.whitespace, "drop": args.drop,
+                  "change_rate": args.change_rate, "commits": args.commits, "seed": args.seed}
+        result = bench_repo(config, jobs=args.jobs, stub_formatter=args.stub_formatter,
+                            workdir=args.workdir, keep=args.keep)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+        if args.json:
+            json.dump(result, sys.stdout, indent=2)
+            print()
+        else:
+            print(f"{result['counts']['candidates']} candidates, formatter: {result['formatter']}, "
+                  f"diff engine: {result['diff_engine']}, generated in {result['generate_seconds']:.1f} s")
+            for name, stage in result["stages"].items():
+                print(f"{name:<18} {stage['seconds'] * 1000:10.1f} ms  git x{stage['git_spawns']:<4} "
+                      f"clickhouse-format x{stage['format_spawns']}")
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+            print("\n".join(compare_stages(result, baseline)), file=sys.stderr if args.json else sys.stdout)
+        return
+    if args.command == "diff":
+        results = [bench_diff(n, args.change_rate, args.repeat, args.engines or default_engines(shape), shape=shape)
+                   for shape in args.shapes for n in args.statements]
+        if args.json:
+            json.dump(results, sys.stdout, indent=2)
+            print()
+            return
+        for result in results:
+            timings = result["engines"]
+            line = f"{result['shape']:<10} {result['lines1']:>7} lines:"
+            for name in timings:
+                line += f"  {name} {timings[name]['diff_seconds'] * 1000:9.1f} ms"
+            if "ndiff" in timings and "patience" in timings:
+                line += f"  speedup x{timings['ndiff']['diff_seconds'] / timings['patience']['diff_seconds']:.1f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 import subprocess
 import platform
 import re
+import os
+import hashlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import count, span
 
 DEBUG = False
 
+# Размер пакета документов на один запуск clickhouse-format
+BATCH_SIZE = 200
+
 def clean_sql_query(sql_query: str) -> str:
     """
     Очищает SQL запрос от повторяющихся пробелов и подстрок вида "\r\n" и "/r/n".
@@ -19,6 +28,136 @@ def clean_sql_query(sql_query: str) -> str:
     cleaned = cleaned.strip()
     return cleaned
 
+_QUOTED_SQL_RE = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`(?:[^`\\]|\\.)*`""")
+_QUOTE_CHARS_RE = re.compile(r"['\"`]")
+_SPECIAL_SQL_RE = re.compile(r"/\*|\*/")
+
+def split_statements(lines: list) -> list:
+    """
+    Делит строки SQL на инструкции по ';' верхнего уровня в конце строки
+    (так clickhouse-format -n завершает каждый запрос). Пустые строки между
+    инструкциями выделяются в отдельные интервалы.
+
+    :param lines: Строки отформатированного SQL
+    :return: Список полуинтервалов (start, end) по номерам строк
+    """
+    bounds = []
+    start = 0
+    quote = None
+    in_block_comment = False
+    for n, line in enumerate(lines):
+        simple = None
+        if quote is None and not in_block_comment:
+            # Быстрый путь: закрытые в пределах строки литералы убираются регулярным выражением,
+            # если после этого нет кавычек и блочных комментариев, хватает проверки конца строки
+            simple = line
+            if _QUOTE_CHARS_RE.search(line):
+                simple = _QUOTED_SQL_RE.sub("0", line)
+                if _QUOTE_CHARS_RE.search(simple):
+                    simple = None
+            if simple is not None and "/" in simple and _SPECIAL_SQL_RE.search(simple):
+                simple = None
+            if simple is not None:
+                simple = simple.split("--", 1)[0]
+        if simple is not None:
+            if start == n and not line.strip():
+                if bounds and bounds[-1][1] == n and not "".join(lines[bounds[-1][0]:n]).strip():
+                    bounds[-1] = (bounds[-1][0], n + 1)
+                else:
+                    bounds.append((n, n + 1))
+                start = n + 1
+            elif simple.rstrip().endswith(";"):
+                bounds.append((start, n + 1))
+                start = n + 1
+            continue
+        ends_with_semicolon = False
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if in_block_comment:
+                if line.startswith("*/", i):
+                    in_block_comment = False
+                    i += 2
+                    continue
+            elif quote:
+                if ch == "\\":
+                    i += 2
+                    continue
+                if ch == quote:
+                    quote = None
+            elif ch in "'\"`":
+                quote = ch
+                ends_with_semicolon = False
+            elif line.startswith("--", i):
+                break
+            elif line.startswith("/*", i):
+                in_block_comment = True
+                i += 2
+                continue
+            elif ch == ";":
+                ends_with_semicolon = True
+            elif not ch.isspace():
+                ends_with_semicolon = False
+            i += 1
+        if start == n and not line.strip() and quote is None and not in_block_comment:
+            # Пустая строка перед инструкцией: продолжаем интервал пустых строк
+            if bounds and bounds[-1][1] == n and not "".join(lines[bounds[-1][0]:n]).strip():
+                bounds[-1] = (bounds[-1][0], n + 1)
+            else:
+                bounds.append((n, n + 1))
+            start = n + 1
+            continue
+        if ends_with_semicolon and quote is None and not in_block_comment:
+            bounds.append((start, n + 1))
+            start = n + 1
+    if start < len(lines):
+        bounds.append((start, len(lines)))
+    return bounds
+
+def statement_hash(lines: list) -> str:
+    """
+    Стабильный хэш инструкции: не зависит от пустых строк и пробелов в конце строк.
+    """
+    text = "\n".join(line.rstrip() for line in lines if line.strip())
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def clickhouse_format_command() -> list:
+    """
+    Возвращает команду запуска clickhouse-format для текущей ОС.
+    """
+    system_name = platform.system()
+    if DEBUG:
+        print(f"system_name: {system_name}")
+    if system_name == "Darwin":  # MacOS
+        return ["clickhouse", "format", "-n"]
+    # Linux и другие
+    return ["clickhouse-format", "-n"]
+
+def run_clickhouse_format(text: str) -> str:
+    """
+    Один запуск clickhouse-format над текстом (без очистки).
+
+    :param text: Текст одного или нескольких SQL запросов
+    :return: Вывод clickhouse-format
+    :raises Exception: Если clickhouse-format завершился с ошибкой
+    """
+    count("format.spawn")
+    count("format.bytes_in", len(text))
+    with span("clickhouse-format", chars=len(text)):
+        process = subprocess.Popen(
+            clickhouse_format_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        stdout, stderr = process.communicate(input=text)
+    if process.returncode != 0:
+        if DEBUG:
+            print(f"Запрос на выходе:\n{stderr.strip()}")
+        raise Exception(f"clickhouse-format error: {stderr.strip()}")
+    return stdout
+
 def format_sql_with_clickhouse_format(sql_query: str) -> str:
     """
     Форматирует SQL запрос с помощью утилиты clickhouse-format.
@@ -31,34 +170,118 @@ def format_sql_with_clickhouse_format(sql_query: str) -> str:
     try:
         # Очистка SQL запроса перед форматированием
         sql_query = clean_sql_query(sql_query)
-
-        # Определяем команду в зависимости от ОС
-        system_name = platform.system()
-        if system_name == "Darwin":  # MacOS
-            if DEBUG:
-                print(f"system_name: {system_name}")            
-            cmd = ["clickhouse", "format", "-n"]
-        else:  # Linux и другие
-            if DEBUG:
-                print(f"system_name: {system_name}")
-            cmd = ["clickhouse-format", "-n"]
-        
-        # Запускаем процесс clickhouse-format
-        process = subprocess.Popen(
-            cmd, 
-            stdin=subprocess.PIPE, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        # Передаем запрос на форматирование и получаем результат
-        stdout, stderr = process.communicate(input=sql_query)
-        if process.returncode != 0:
-            if DEBUG:
-                print(f"Запрос на выходе:\n{stderr.strip()}")
-            raise Exception(f"clickhouse-format error: {stderr.strip()}")
+        stdout = run_clickhouse_format(sql_query)
         if DEBUG:
             print(f"Запрос на выходе:\n{stdout.strip()}")
         return stdout.strip()
     except Exception as e:
         return f"Error: {str(e)}"
+
+def _format_batch(cleaned_queries: list) -> list:
+    """
+    Форматирует пакет уже очищенных документов одним запуском clickhouse-format.
+    Документы разделяются запросами-маркерами, по которым вывод разрезается обратно.
+    Если пакет не отформатировался, он делится пополам, пока ошибочный документ
+    не будет отформатирован отдельно (и получит свой "Error: ...").
+    """
+    if len(cleaned_queries) == 1:
+        return [format_sql_with_clickhouse_format(cleaned_queries[0])]
+
+    marker = f"__ch_format_doc_{uuid.uuid4().hex}__"
+    marker_query = f"SELECT '{marker}';"
+    parts = []
+    for query in cleaned_queries:
+        # Перевод строки перед ';' закрывает возможный однострочный комментарий в конце документа
+        parts.append(query.rstrip().rstrip(';'))
+        parts.append(f"\n;\n{marker_query}\n")
+    try:
+        stdout = run_clickhouse_format("".join(parts))
+        # clickhouse-format -n ставит ';' после запроса отдельной строкой: она уходит вместе с маркером
+        segments = re.split(rf"^.*{marker}.*$(?:\s*^[ \t]*;[ \t]*$)?", stdout, flags=re.MULTILINE)
+        # После последнего маркера остается пустой хвост
+        if len(segments) != len(cleaned_queries) + 1 or segments[-1].strip():
+            raise Exception("unexpected batch separators in clickhouse-format output")
+        return [segment.strip() for segment in segments[:-1]]
+    except FileNotFoundError as e:
+        # clickhouse-format не установлен: делить пакет бессмысленно
+        return [f"Error: {str(e)}"] * len(cleaned_queries)
+    except Exception:
+        middle = len(cleaned_queries) // 2
+        return _format_batch(cleaned_queries[:middle]) + _format_batch(cleaned_queries[middle:])
+
+def format_sql_batch(sql_queries: list) -> list:
+    """
+    Форматирует несколько SQL документов за один запуск clickhouse-format.
+
+    :param sql_queries: Список текстов SQL (каждый может содержать несколько запросов)
+    :return: Список результатов в том же порядке; для ошибочных документов "Error: ..."
+    """
+    results = [None] * len(sql_queries)
+    batch, positions = [], []
+    empty_result = None
+    for i, sql_query in enumerate(sql_queries):
+        cleaned = clean_sql_query(sql_query)
+        if not cleaned:
+            # Пустой документ не дает запросов в выводе -n, форматируем его один раз отдельно
+            if empty_result is None:
+                empty_result = format_sql_with_clickhouse_format("")
+            results[i] = empty_result
+            continue
+        batch.append(cleaned)
+        positions.append(i)
+    if batch:
+        for i, formatted in zip(positions, _format_batch(batch)):
+            results[i] = formatted
+    return results
+
+
+class ClickHouseFormatPool:
+    """
+    Пул воркеров, каждый из которых форматирует по одному пакету за раз
+    отдельным процессом clickhouse-format.
+
+    :param width: Число одновременно запущенных процессов clickhouse-format
+    :param batch_size: Число документов в одном пакете
+    """
+    def __init__(self, width: int = None, batch_size: int = BATCH_SIZE):
+        self.width = width or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=self.width, thread_name_prefix="ch-format")
+
+    def format_many(self, sql_queries: list) -> list:
+        """
+        :param sql_queries: Список текстов SQL
+        :return: Список отформатированных текстов в том же порядке
+        """
+        sql_queries = list(sql_queries)
+        if not sql_queries:
+            return []
+        # Делим так, чтобы загрузить все воркеры, но не больше batch_size в пакете
+        size = max(1, min(self.batch_size, -(-len(sql_queries) // self.width)))
+        chunks = [sql_queries[i:i + size] for i in range(0, len(sql_queries), size)]
+        results = []
+        for chunk_result in self._executor.map(format_sql_batch, chunks):
+            results.extend(chunk_result)
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_default_pool = None
+
+def get_format_pool() -> ClickHouseFormatPool:
+    """
+    Общий пул форматирования; ширину можно задать переменной окружения CH_FORMAT_WORKERS.
+    """
+    global _default_pool
+    if _default_pool is None:
+        width = int(os.environ.get("CH_FORMAT_WORKERS", "0")) or None
+        _default_pool = ClickHouseFormatPool(width=width)
+    return _default_pool
+
+def format_sql_many(sql_queries: list) -> list:
+    """
+    Форматирует список SQL документов пакетами на общем пуле.
+    """
+    return get_format_pool().format_many(sql_queries)
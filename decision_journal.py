@@ -0,0 +1,123 @@
+import json
+import os
+
+from git_utils import git_commit_all, git_restore_files_from_branch, run_git_command
+
+
+class DecisionJournal:
+    """
+    Журнал выбранных версий файлов. Решения копятся в памяти и дописываются на диск
+    (JSON Lines в каталоге .git), поэтому прерванную сессию можно продолжить.
+    При коммите журнал применяется пакетно: один restore для файлов из branch1,
+    одна запись blob'ов для отредактированных файлов из branch2 и один коммит.
+    """
+    def __init__(self, branch1, branch2, branch3, path=None):
+        self.branch1 = branch1
+        self.branch2 = branch2
+        self.branch3 = branch3
+        self.path = path or default_journal_path(branch3)
+        self.decisions = {}  # path -> {"branch": ..., "content": ..., "mode": ...}
+        self._checked = False  # заголовок журнала на диске проверен
+
+    def _header(self):
+        return {"branch1": self.branch1, "branch2": self.branch2, "branch3": self.branch3}
+
+    def load(self):
+        """
+        Загружает решения прерванной сессии для тех же веток.
+        Журнал другой сессии или с нечитаемым заголовком откладывается в файл .stale,
+        недописанный после аварийного завершения хвост отбрасывается.
+
+        :return: Число восстановленных решений
+        """
+        self._checked = True
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+        if not self._header_matches(lines[0] if lines else ""):
+            self._rotate()
+            return 0
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Недописанная последняя строка: переписываем журнал, иначе следующая
+                # запись склеится с ней и все решения после нее будут потеряны
+                self._rewrite()
+                break
+            self.decisions[record["path"]] = {k: record.get(k) for k in ("branch", "content", "mode")}
+        return len(self.decisions)
+
+    def _header_matches(self, line):
+        try:
+            return json.loads(line) == self._header()
+        except ValueError:
+            return False
+
+    def _rotate(self):
+        os.replace(self.path, self.path + ".stale")
+
+    def _rewrite(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self._header(), ensure_ascii=False) + "\n")
+            for file_path, decision in self.decisions.items():
+                f.write(json.dumps(dict(path=file_path, **decision), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def record(self, file_path, branch, content=None, mode="100644"):
+        decision = {"branch": branch, "content": content, "mode": mode}
+        self.decisions[file_path] = decision
+        if not self._checked:
+            # Без load(): чужой журнал с тем же путем не продолжаем
+            self._checked = True
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf-8", errors="replace") as f:
+                    if not self._header_matches(f.readline()):
+                        self._rotate()
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", encoding="utf-8") as f:
+            if new_file:
+                f.write(json.dumps(self._header(), ensure_ascii=False) + "\n")
+            f.write(json.dumps(dict(path=file_path, **decision), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def paths_for(self, branch):
+        return [p for p, d in self.decisions.items() if d["branch"] == branch]
+
+    def apply_and_commit(self, message, workspace=None):
+        """
+        Применяет все решения и делает один коммит.
+
+        :param workspace: IndexWorkspace для режима --worktree, иначе рабочая копия
+        """
+        restore = self.paths_for(self.branch1)
+        # Без содержимого (двоичные и большие файлы) остается версия branch2, уже лежащая в branch3
+        edits = {p: (self.decisions[p]["content"], self.decisions[p]["mode"]) for p in self.paths_for(self.branch2)
+                 if self.decisions[p]["content"] is not None}
+        if workspace is not None:
+            workspace.restore_paths(self.branch1, restore)
+            workspace.write_contents(edits)
+            workspace.commit(message)
+        else:
+            git_restore_files_from_branch(restore, self.branch1)
+            for file_path, (content, _) in edits.items():
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(content)
+            git_commit_all(message)
+        self.clear()
+
+    def clear(self):
+        self.decisions.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def default_journal_path(branch3):
+    git_dir = run_git_command(["rev-parse", "--absolute-git-dir"])
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in branch3)
+    return os.path.join(git_dir, f"merge_journal_{safe_name}.jsonl")
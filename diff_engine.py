@@ -0,0 +1,372 @@
+import bisect
+import difflib
+import os
+
+from ch_format import split_statements, statement_hash
+
+
+class DiffEngine:
+    """
+    Построчное сравнение текстов. Результат в виде опкодов как у difflib.SequenceMatcher:
+    (tag, i1, i2, j1, j2), tag из 'equal', 'delete', 'insert', 'replace'.
+    """
+    name = None
+
+    def opcodes(self, lines1, lines2):
+        raise NotImplementedError
+
+    def equal(self, lines1, lines2):
+        """
+        Быстрая проверка равенства без построения диффа (останавливается на первом отличии).
+        """
+        return len(lines1) == len(lines2) and lines1 == lines2
+
+    def diff_lines(self, lines1, lines2):
+        """
+        Строки в формате ndiff без строк-подсказок '?': '- ' удалено, '+ ' добавлено, '  ' без изменений.
+        """
+        for tag, i1, i2, j1, j2 in self.opcodes(lines1, lines2):
+            if tag == 'equal':
+                for line in lines1[i1:i2]:
+                    yield '  ' + line
+                continue
+            for line in lines1[i1:i2]:
+                yield '- ' + line
+            for line in lines2[j1:j2]:
+                yield '+ ' + line
+
+    def analyze(self, lines1, lines2):
+        """
+        Полный результат сравнения для кэша и фильтров.
+        """
+        if self.equal(lines1, lines2):
+            return DiffResult(equal_opcodes(lines1), [])
+        opcodes = self.opcodes(lines1, lines2)
+        return DiffResult(opcodes, changed_lines_from_opcodes(lines1, lines2, opcodes))
+
+
+class DiffResult:
+    """
+    :param opcodes: Опкоды по строкам
+    :param changed_lines: Измененные строки ('- ...' / '+ ...') без перемещенных инструкций
+    :param changed_statements: Тексты добавленных, удаленных и измененных инструкций
+        (None, если движок не разбирает текст на инструкции)
+    :param moved: Число перемещенных без изменений инструкций
+    """
+    __slots__ = ("opcodes", "changed_lines", "changed_statements", "moved")
+
+    def __init__(self, opcodes, changed_lines, changed_statements=None, moved=0):
+        self.opcodes = opcodes
+        self.changed_lines = changed_lines
+        self.changed_statements = changed_statements
+        self.moved = moved
+
+
+class NdiffEngine(DiffEngine):
+    """
+    Прежнее поведение на difflib.ndiff (медленно на больших файлах, оставлено для сравнения).
+    """
+    name = "ndiff"
+
+    def opcodes(self, lines1, lines2):
+        return difflib.SequenceMatcher(None, lines1, lines2).get_opcodes()
+
+    def diff_lines(self, lines1, lines2):
+        for line in difflib.ndiff(lines1, lines2):
+            if not line.startswith('?'):
+                yield line
+
+
+def hash_lines(lines1, lines2):
+    """
+    Заменяет строки целыми числами (одинаковые строки - одинаковые числа) для быстрых сравнений.
+    """
+    ids = {}
+    seq1 = [ids.setdefault(line, len(ids)) for line in lines1]
+    seq2 = [ids.setdefault(line, len(ids)) for line in lines2]
+    return seq1, seq2
+
+
+# Редкие общие строки как опоры: не чаще этого числа вхождений с каждой стороны
+MAX_ANCHOR_OCCURRENCES = 64
+
+# Остаток без опор сравнивается SequenceMatcher, только если он не больше этого числа ячеек
+# (произведение длин); больший остаток считается заменой целиком
+FALLBACK_MAX_CELLS = 250000
+
+
+def _anchors(a, alo, ahi, b, blo, bhi):
+    # Опоры как в histogram diff: самые редкие строки, встречающиеся одинаковое число раз
+    # с обеих сторон (обычно ровно один раз - как в patience diff); k-е вхождение слева
+    # сопоставляется k-му справа. Из них берется наибольшая возрастающая по обеим сторонам
+    # цепочка (patience sorting).
+    positions_a = {}
+    for i in range(alo, ahi):
+        positions_a.setdefault(a[i], []).append(i)
+    positions_b = {}
+    for j in range(blo, bhi):
+        if b[j] in positions_a:
+            positions_b.setdefault(b[j], []).append(j)
+    occurrences = min((len(pb) for line, pb in positions_b.items() if len(positions_a[line]) == len(pb)),
+                      default=None)
+    if occurrences is None or occurrences > MAX_ANCHOR_OCCURRENCES:
+        return []
+    candidates = sorted(pair for line, pb in positions_b.items() if len(pb) == occurrences
+                        and len(positions_a[line]) == occurrences for pair in zip(positions_a[line], pb))
+    tails = []        # j последних элементов стопок
+    tail_index = []   # индекс кандидата на вершине стопки
+    previous = [None] * len(candidates)
+    for k, (_, j) in enumerate(candidates):
+        pile = bisect.bisect_left(tails, j)
+        if pile == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pile] = j
+            tail_index[pile] = k
+        previous[k] = tail_index[pile - 1] if pile > 0 else None
+    chain = []
+    k = tail_index[-1]
+    while k is not None:
+        chain.append(candidates[k])
+        k = previous[k]
+    chain.reverse()
+    return chain
+
+
+def patience_matches(a, b):
+    """
+    Пары совпавших индексов (i, j) для последовательностей a и b.
+    """
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        # Общие начало и конец
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _anchors(a, alo, ahi, b, blo, bhi)
+        if not anchors:
+            # Нет подходящих опор: небольшой остаток сравниваем обычным алгоритмом.
+            # autojunk отбрасывает частые строки, иначе на повторяющихся блоках время почти кубическое
+            if (ahi - alo) * (bhi - blo) <= FALLBACK_MAX_CELLS:
+                matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi])
+                for i, j, size in matcher.get_matching_blocks():
+                    matches.extend((alo + i + k, blo + j + k) for k in range(size))
+            continue
+        for i, j in anchors:
+            matches.append((i, j))
+            regions.append((alo, i, blo, j))
+            alo, blo = i + 1, j + 1
+        regions.append((alo, ahi, blo, bhi))
+    matches.sort()
+    return matches
+
+
+def matches_to_opcodes(matches, len1, len2):
+    opcodes = []
+    i = j = 0
+    for mi, mj in matches + [(len1, len2)]:
+        if i < mi or j < mj:
+            tag = 'replace' if i < mi and j < mj else ('delete' if i < mi else 'insert')
+            opcodes.append((tag, i, mi, j, mj))
+        if mi < len1 and mj < len2:
+            if opcodes and opcodes[-1][0] == 'equal':
+                _, i1, _, j1, _ = opcodes[-1]
+                opcodes[-1] = ('equal', i1, mi + 1, j1, mj + 1)
+            else:
+                opcodes.append(('equal', mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return opcodes
+
+
+class PatienceDiffEngine(DiffEngine):
+    """
+    Patience diff по хэшам строк: близко к линейному времени на типичных SQL файлах.
+    """
+    name = "patience"
+
+    def opcodes(self, lines1, lines2):
+        seq1, seq2 = hash_lines(lines1, lines2)
+        return matches_to_opcodes(patience_matches(seq1, seq2), len(seq1), len(seq2))
+
+
+class StatementDiffEngine(DiffEngine):
+    """
+    Сравнение многоинструкционного SQL по инструкциям: одинаковые инструкции сопоставляются
+    по хэшу, перемещенные распознаются как перемещение ('move_from' / 'move_to'),
+    построчно сравниваются только измененные инструкции.
+    """
+    name = "statement"
+
+    def __init__(self, line_engine=None):
+        self.line_engine = line_engine or PatienceDiffEngine()
+
+    def opcodes(self, lines1, lines2):
+        return self.analyze(lines1, lines2).opcodes
+
+    def analyze(self, lines1, lines2):
+        if self.equal(lines1, lines2):
+            return DiffResult(equal_opcodes(lines1), [])
+        bounds1 = split_statements(lines1)
+        bounds2 = split_statements(lines2)
+        hashes1 = [statement_hash(lines1[a:b]) for a, b in bounds1]
+        hashes2 = [statement_hash(lines2[a:b]) for a, b in bounds2]
+        matches = patience_matches(hashes1, hashes2)
+
+        # Инструкции без пары на своем месте, но с тем же хэшем на другой стороне - перемещенные
+        matched1 = {i for i, _ in matches}
+        matched2 = {j for _, j in matches}
+        unmatched2 = {}
+        for j, h in enumerate(hashes2):
+            if j not in matched2:
+                unmatched2.setdefault(h, []).append(j)
+        moved1, moved2 = set(), set()
+        for i, h in enumerate(hashes1):
+            if i not in matched1 and unmatched2.get(h):
+                moved1.add(i)
+                moved2.add(unmatched2[h].pop(0))
+
+        result = DiffResult([], [], [], len(moved1))
+        cursor = [0, 0]  # обработано строк в lines1 и lines2
+
+        def emit(tag, a1, b1, a2, b2):
+            result.opcodes.append((tag, a1, b1, a2, b2))
+            cursor[0], cursor[1] = b1, b2
+
+        def emit_delete(i):
+            a, b = bounds1[i]
+            emit('move_from' if i in moved1 else 'delete', a, b, cursor[1], cursor[1])
+            if i not in moved1:
+                result.changed_lines.extend('- ' + line for line in lines1[a:b])
+                result.changed_statements.append("\n".join(lines1[a:b]))
+
+        def emit_insert(j):
+            a, b = bounds2[j]
+            emit('move_to' if j in moved2 else 'insert', cursor[0], cursor[0], a, b)
+            if j not in moved2:
+                result.changed_lines.extend('+ ' + line for line in lines2[a:b])
+                result.changed_statements.append("\n".join(lines2[a:b]))
+
+        def emit_pair(i, j, changed_statement):
+            (a1, b1), (a2, b2) = bounds1[i], bounds2[j]
+            part1, part2 = lines1[a1:b1], lines2[a2:b2]
+            if part1 == part2:
+                emit('equal', a1, b1, a2, b2)
+                return
+            opcodes = self.line_engine.opcodes(part1, part2)
+            for tag, i1, i2, j1, j2 in opcodes:
+                emit(tag, a1 + i1, a1 + i2, a2 + j1, a2 + j2)
+            result.changed_lines.extend(changed_lines_from_opcodes(part1, part2, opcodes))
+            if changed_statement:
+                result.changed_statements.append("\n".join(part1))
+                result.changed_statements.append("\n".join(part2))
+
+        si = sj = 0
+        for mi, mj in matches + [(len(bounds1), len(bounds2))]:
+            # Промежуток между совпавшими инструкциями: измененные инструкции сопоставляются
+            # по порядку, остальные - удаленные / добавленные / перемещенные
+            gap1 = list(range(si, mi))
+            gap2 = list(range(sj, mj))
+            pairs = list(zip([i for i in gap1 if i not in moved1], [j for j in gap2 if j not in moved2]))
+            p1 = p2 = 0
+            for pair_i, pair_j in pairs + [(mi, mj)]:
+                while p1 < len(gap1) and gap1[p1] != pair_i:
+                    emit_delete(gap1[p1])
+                    p1 += 1
+                while p2 < len(gap2) and gap2[p2] != pair_j:
+                    emit_insert(gap2[p2])
+                    p2 += 1
+                if pair_i < mi:
+                    emit_pair(pair_i, pair_j, changed_statement=True)
+                    p1 += 1
+                    p2 += 1
+            # Инструкция, совпавшая по хэшу (может отличаться пустыми строками)
+            if mi < len(bounds1):
+                emit_pair(mi, mj, changed_statement=False)
+            si, sj = mi + 1, mj + 1
+        result.opcodes = _merge_opcodes(result.opcodes)
+        return result
+
+
+def _merge_opcodes(opcodes):
+    # Соседние 'equal' объединяются
+    merged = []
+    for op in opcodes:
+        if merged and op[0] == 'equal' and merged[-1][0] == 'equal' \
+                and merged[-1][2] == op[1] and merged[-1][4] == op[3]:
+            merged[-1] = ('equal', merged[-1][1], op[2], merged[-1][3], op[4])
+        else:
+            merged.append(op)
+    return merged
+
+
+def equal_opcodes(lines):
+    """
+    Опкоды для двух одинаковых последовательностей строк.
+    """
+    return [('equal', 0, len(lines), 0, len(lines))] if lines else []
+
+
+def changed_lines_from_opcodes(lines1, lines2, opcodes):
+    """
+    Удаленные и добавленные строки ('- ...' / '+ ...') по готовым опкодам.
+    """
+    changed = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag != 'equal':
+            changed.extend('- ' + line for line in lines1[i1:i2])
+            changed.extend('+ ' + line for line in lines2[j1:j2])
+    return changed
+
+
+def diff_rows(lines1, lines2, opcodes, context=None):
+    """
+    Строки для отображения сравнения: (текст, тег), тег None / 'deleted' / 'added' / 'moved' / 'collapsed'.
+
+    :param opcodes: Опкоды DiffEngine.opcodes для lines1 и lines2
+    :param context: Если задано, длинные участки совпадающих строк сворачиваются
+        до context строк по краям и одной строки-заглушки
+    """
+    for n, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag != 'equal':
+            moved = tag in ('move_from', 'move_to')
+            for line in lines1[i1:i2]:
+                yield '- ' + line, 'moved' if moved else 'deleted'
+            for line in lines2[j1:j2]:
+                yield '+ ' + line, 'moved' if moved else 'added'
+            continue
+        # В начале и в конце файла контекст нужен только с одной стороны
+        head = 0 if n == 0 else (context or 0)
+        tail = 0 if n == len(opcodes) - 1 else (context or 0)
+        if context is None or i2 - i1 <= head + tail + 1:
+            for line in lines1[i1:i2]:
+                yield '  ' + line, None
+            continue
+        for line in lines1[i1:i1 + head]:
+            yield '  ' + line, None
+        yield f'  ... {i2 - i1 - head - tail} совпадающих строк ...', 'collapsed'
+        for line in lines1[i2 - tail:i2]:
+            yield '  ' + line, None
+
+
+ENGINES = {engine.name: engine for engine in (NdiffEngine(), PatienceDiffEngine(), StatementDiffEngine())}
+# Классификация сравнивает построчно (быстрее, с ранним выходом при равенстве),
+# показ - по инструкциям, чтобы перемещенные инструкции были видны отдельно
+DEFAULT_ENGINE = "patience"
+DISPLAY_ENGINE = "statement"
+
+
+def get_diff_engine(name=None):
+    """
+    :param name: Имя движка из ENGINES; по умолчанию переменная окружения DIFF_ENGINE или patience
+    """
+    return ENGINES[name or os.environ.get("DIFF_ENGINE") or DEFAULT_ENGINE]
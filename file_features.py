@@ -0,0 +1,109 @@
+from diff_engine import DISPLAY_ENGINE, get_diff_engine
+from sql_tokens import TokenizeError, canonical_tokens
+
+
+class FileFeatures:
+    """
+    Компактное описание отличий файла между ветками, вычисляется один раз на пару содержимого.
+    Фильтры списка файлов работают только с этими записями, без повторного чтения и форматирования.
+    """
+    __slots__ = ("has_diff", "has_drop", "has_blank", "blank_only", "extra")
+
+    def __init__(self, has_diff=False, has_drop=False, has_blank=False, blank_only=False, extra=None):
+        self.has_diff = has_diff          # есть отличия после форматирования
+        self.has_drop = has_drop          # в отличиях упоминается DROP
+        self.has_blank = has_blank        # среди отличий есть пустые строки
+        self.blank_only = blank_only      # отличия только в пустых строках
+        self.extra = extra or {}          # признаки из register_feature
+
+    def __repr__(self):
+        return (f"FileFeatures(has_diff={self.has_diff}, has_drop={self.has_drop}, "
+                f"has_blank={self.has_blank}, blank_only={self.blank_only}, extra={self.extra})")
+
+
+# Дополнительные признаки: имя -> функция(changed_lines) над строками отличий ('+ ...' / '- ...')
+FEATURE_EXTRACTORS = {}
+
+# Фильтры списка: имя -> предикат "скрыть файл" над FileFeatures
+FILTERS = {
+    "hide_same": lambda features: not features.has_diff,
+    "hide_drop": lambda features: features.has_drop or features.has_blank,
+}
+
+
+def register_feature(name, extractor):
+    """
+    Регистрирует дополнительный признак; он вычисляется в том же проходе, что и основные.
+    """
+    FEATURE_EXTRACTORS[name] = extractor
+
+
+def register_filter(name, predicate):
+    """
+    Регистрирует фильтр над FileFeatures; применение не требует повторного прохода по файлам.
+    """
+    FILTERS[name] = predicate
+
+
+def classify_lines(lines1, lines2):
+    """
+    Признаки для фильтров. Отличия ищутся построчным диффом (равные файлы - без диффа);
+    дифф по инструкциям нужен только для признака DROP и строится, лишь если DROP есть в тексте.
+
+    :param lines1: Отформатированные строки из branch1
+    :param lines2: Отформатированные строки из branch2
+    :return: FileFeatures
+    """
+    result = get_diff_engine().analyze(lines1, lines2)
+    changed_statements = result.changed_statements
+    if changed_statements is None:
+        changed_statements = []
+        if result.changed_lines and ('DROP' in "\n".join(lines1).upper() or 'DROP' in "\n".join(lines2).upper()):
+            changed_statements = get_diff_engine(DISPLAY_ENGINE).analyze(lines1, lines2).changed_statements
+    return features_from_changed_lines(result.changed_lines, changed_statements, result.moved)
+
+
+def features_from_diff_result(result):
+    """
+    :param result: diff_engine.DiffResult
+    :return: FileFeatures
+    """
+    return features_from_changed_lines(result.changed_lines, result.changed_statements, result.moved)
+
+
+def features_from_changed_lines(lines, changed_statements=None, moved=0):
+    """
+    :param lines: Строки отличий ('- ...' / '+ ...')
+    :param changed_statements: Тексты измененных инструкций, если дифф строился по инструкциям:
+        тогда DROP ищется среди ключевых слов этих инструкций, а не подстрокой в строках
+    :param moved: Число перемещенных инструкций (это тоже отличие)
+    :return: FileFeatures
+    """
+    blank = [line.strip() in {'+', '-', '+ ', '- ', ''} for line in lines]
+    if changed_statements is None:
+        has_drop = any('DROP' in line.upper() for line in lines)
+    else:
+        has_drop = any(statement_has_drop(statement) for statement in changed_statements)
+    return FileFeatures(
+        has_diff=bool(lines) or moved > 0,
+        has_drop=has_drop,
+        has_blank=any(blank),
+        blank_only=bool(lines) and all(blank),
+        extra={name: extractor(lines) for name, extractor in FEATURE_EXTRACTORS.items()},
+    )
+
+
+def statement_has_drop(statement):
+    # DROP как ключевое слово, а не часть имени или строки
+    try:
+        return 'DROP' in canonical_tokens(statement)
+    except TokenizeError:
+        return 'DROP' in statement.upper()
+
+
+def is_hidden(features, active_filters):
+    """
+    :param active_filters: Имена включенных фильтров из FILTERS
+    :return: True, если файл нужно скрыть
+    """
+    return any(FILTERS[name](features) for name in active_filters)
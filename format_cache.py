@@ -0,0 +1,199 @@
+import hashlib
+import inspect
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+from ch_format import clean_sql_query, clickhouse_format_command, format_sql_many
+from git_utils import run_git_command
+from profiling import count
+
+# Предел размера кэша (сумма длин отформатированных текстов)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_FILE_NAME = "ch_format_cache.sqlite"
+
+
+def git_blob_sha(text: str) -> str:
+    """
+    SHA blob-объекта git для текста (то же, что вернет git hash-object).
+    """
+    data = text.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def formatter_version() -> str:
+    """
+    Версия clickhouse-format, входит в ключ кэша.
+    """
+    try:
+        result = subprocess.run(clickhouse_format_command()[:-1] + ["--version"],
+                                stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=30)
+        return result.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def cleaning_rules_version() -> str:
+    """
+    Хэш правил очистки clean_sql_query: изменение правил инвалидирует кэш.
+    """
+    return hashlib.sha1(inspect.getsource(clean_sql_query).encode("utf-8")).hexdigest()[:16]
+
+
+class FormatCache:
+    """
+    Постоянный кэш отформатированного SQL в SQLite.
+    Ключ: (SHA blob'а исходного текста, версия clickhouse-format, правила очистки).
+    Вытеснение LRU по суммарному размеру, счетчики попаданий и промахов.
+
+    :param path: Путь к файлу базы (":memory:" для кэша без диска)
+    :param max_bytes: Предел суммарного размера значений
+    """
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, version: str = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version or f"{formatter_version()}|{cleaning_rules_version()}"
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS formatted ("
+            " blob_sha TEXT NOT NULL, version TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (blob_sha, version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS formatted_last_used ON formatted (last_used)")
+        self._conn.commit()
+
+    def get_many(self, blob_shas: list) -> dict:
+        """
+        :return: {blob_sha: отформатированный текст} для найденных ключей
+        """
+        found = {}
+        unique = list(dict.fromkeys(blob_shas))
+        with self._lock:
+            # Ограничение SQLite на число параметров в запросе
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT blob_sha, value FROM formatted WHERE version = ? AND blob_sha IN ({placeholders})",
+                    [self.version] + chunk,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE formatted SET last_used = ? WHERE blob_sha = ? AND version = ?",
+                    [(now, sha, self.version) for sha in found],
+                )
+                self._conn.commit()
+            hits = sum(1 for sha in blob_shas if sha in found)
+            self.hits += hits
+            self.misses += len(blob_shas) - hits
+        count("format_cache.hit", hits)
+        count("format_cache.miss", len(blob_shas) - hits)
+        return found
+
+    def put_many(self, items: dict):
+        """
+        :param items: {blob_sha: отформатированный текст}
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO formatted (blob_sha, version, value, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(sha, self.version, value, len(value), now) for sha, value in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM formatted").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Вытесняем давно не использованные записи до 90% предела
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for blob_sha, version, size in self._conn.execute(
+                "SELECT blob_sha, version, size FROM formatted ORDER BY last_used"):
+            if freed >= target:
+                break
+            stale.append((blob_sha, version))
+            freed += size
+        self._conn.executemany("DELETE FROM formatted WHERE blob_sha = ? AND version = ?", stale)
+
+    def format_many(self, sql_queries: list, blob_shas: list = None) -> list:
+        """
+        Форматирует документы, запуская clickhouse-format только для промахов кэша.
+
+        :param sql_queries: Список текстов SQL
+        :param blob_shas: SHA blob'ов этих текстов, если уже известны (None - вычислить по тексту)
+        :return: Список отформатированных текстов в том же порядке
+        """
+        sql_queries = list(sql_queries)
+        if blob_shas is None:
+            blob_shas = [None] * len(sql_queries)
+        blob_shas = [sha or git_blob_sha(q) for sha, q in zip(blob_shas, sql_queries)]
+        cached = self.get_many(blob_shas)
+        missing = {}
+        for sha, query in zip(blob_shas, sql_queries):
+            if sha not in cached and sha not in missing:
+                missing[sha] = query
+        if missing:
+            formatted = dict(zip(missing, format_sql_many(list(missing.values()))))
+            # Ошибки не кэшируем: они могут быть временными (нет clickhouse-format и т.п.)
+            self.put_many({sha: value for sha, value in formatted.items() if not value.startswith("Error: ")})
+            cached.update(formatted)
+        return [cached[sha] for sha in blob_shas]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_format_cache() -> FormatCache:
+    """
+    Общий кэш в каталоге .git текущего репозитория (в памяти, если репозитория нет).
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                git_dir = run_git_command(["rev-parse", "--absolute-git-dir"])
+                path = os.path.join(git_dir, CACHE_FILE_NAME)
+            except Exception:
+                path = ":memory:"
+            _cache = FormatCache(path)
+        return _cache
+
+
+def format_sql_cached_many(sql_queries: list, blob_shas: list = None) -> list:
+    """
+    Форматирует список SQL документов через общий кэш.
+    """
+    return get_format_cache().format_many(sql_queries, blob_shas)
+
+
+def close_format_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
@@ -1,9 +1,24 @@
 import subprocess
 import os
 import shutil
+import atexit
+import tempfile
+import threading
 
-def run_git_command(args, cwd=None):
-    result = subprocess.run(["git"] + args, cwd=cwd, capture_output=True, text=True)
+from profiling import count, span
+
+def _git_subcommand(args):
+    # "git -c x=y --literal-pathspecs restore ..." -> "restore"
+    i = 0
+    while i < len(args) and args[i].startswith("-"):
+        i += 2 if args[i] == "-c" else 1
+    return args[i] if i < len(args) else ""
+
+def run_git_command(args, cwd=None, input=None):
+    count("git.spawn")
+    with span("git " + _git_subcommand(args)):
+        result = subprocess.run(["git"] + args, cwd=cwd, capture_output=True, text=True, input=input)
+    count("git.bytes_read", len(result.stdout))
     if result.returncode != 0:
         raise Exception(f"Git command failed: git {' '.join(args)}\n{result.stderr.strip()}")
     return result.stdout.strip()
@@ -67,6 +82,44 @@ def git_status_modified_files():
             files.append(file_path)
     return files
 
+_NULL_SHA = "0" * 40
+_DIFF_STATUS_NAMES = {"A": "added", "M": "modified", "D": "deleted", "T": "type-changed"}
+
+def git_diff_blob_changes(branch1, branch2):
+    # Paths whose blob IDs differ between two revisions, from a single "git diff --raw -z".
+    # Byte-identical files never show up here, so they never reach the formatter.
+    # Renames are not detected (diff.renames is on by default): the review and the decisions
+    # are per path, and a renamed file has no branch1 version under its new path
+    output = run_git_command(["diff", "--raw", "-z", "--no-renames", "--no-abbrev", branch1, branch2])
+    tokens = output.split("\0")
+    changes = []
+    i = 0
+    while i < len(tokens):
+        meta = tokens[i]
+        if not meta.startswith(":"):
+            i += 1
+            continue
+        mode1, mode2, sha1, sha2, status = meta[1:].split(" ", 4)
+        letter = status[0]
+        path = tokens[i + 1]
+        i += 2
+        # Submodules are commits, not blobs
+        if "160000" in (mode1, mode2):
+            continue
+        changes.append({
+            "path": path,
+            "status": _DIFF_STATUS_NAMES.get(letter, letter),
+            "blob1": None if sha1 == _NULL_SHA else sha1,
+            "blob2": None if sha2 == _NULL_SHA else sha2,
+            "mode1": mode1,
+            "mode2": mode2,
+        })
+    return changes
+
+def empty_commit_info():
+    # Commit info of a path that does not exist in the branch
+    return {"commit_hash": None, "author": None, "date": None}
+
 def get_file_last_commit_info(branch, file_path):
     # Get last commit hash, author name, date and commit message for a file in branch
     try:
@@ -74,20 +127,409 @@ def get_file_last_commit_info(branch, file_path):
         commit_hash, author, date = result.split("\t")
         return {"commit_hash": commit_hash, "author": author, "date": date}
     except Exception:
-        return {"commit_hash": None, "author": None, "date": None}
+        return empty_commit_info()
+
+_COMMIT_HEADER = "\x01"
+
+class CommitInfoIndex:
+    # Path -> last commit info for one branch, built by a single streaming
+    # "git log --name-only" walk in a background thread. The walk stops as soon
+    # as every requested path has been seen; get() waits only for its own path.
+    def __init__(self, branch, file_paths, cwd=None):
+        self.branch = branch
+        self.cwd = cwd
+        self._requested = set(file_paths)
+        self._pending = set(file_paths)
+        self._info = {}
+        self._done = False
+        self._cond = threading.Condition()
+        self._process = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._build, daemon=True)
+            self._thread.start()
+        return self
+
+    def _build(self):
+        count("git.spawn")
+        with span("git log --name-only", branch=self.branch):
+            self._walk()
+
+    def _walk(self):
+        bytes_read = 0
+        try:
+            # --cc: merge commits list the files changed against every parent (conflict resolutions),
+            # without it merges list no files and such paths would get a pre-merge commit
+            self._process = subprocess.Popen(
+                ["git", "-c", "core.quotePath=false", "log", "--name-only", "--cc", "--no-renames",
+                 f"--format={_COMMIT_HEADER}%H%x09%an%x09%ad", self.branch, "--"],
+                cwd=self.cwd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            )
+            current = None
+            for line in self._process.stdout:
+                bytes_read += len(line)
+                line = line.rstrip("\n")
+                if line.startswith(_COMMIT_HEADER):
+                    commit_hash, author, date = line[1:].split("\t", 2)
+                    current = {"commit_hash": commit_hash, "author": author, "date": date}
+                elif line and current is not None and line in self._pending:
+                    with self._cond:
+                        self._pending.discard(line)
+                        self._info[line] = current
+                        self._cond.notify_all()
+                    if not self._pending:
+                        break
+        except Exception:
+            pass
+        finally:
+            count("git.bytes_read", bytes_read)
+            self._stop_process()
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def _stop_process(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+
+    def __contains__(self, file_path):
+        return file_path in self._requested
+
+    def is_complete(self):
+        return self._done
+
+    def get(self, file_path, timeout=None):
+        # None if the walk has not reached file_path within timeout
+        if file_path not in self._requested:
+            return get_file_last_commit_info(self.branch, file_path)
+        self.start()
+        with self._cond:
+            found = self._cond.wait_for(lambda: file_path in self._info or self._done, timeout=timeout)
+            info = self._info.get(file_path)
+        if not found:
+            return None
+        if info is None:
+            return empty_commit_info()
+        return dict(info)
+
+# Blobs are copied from the cat-file pipe in chunks of this size
+BLOB_READ_CHUNK = 1024 * 1024
+# Like git itself, a NUL byte among the first bytes marks a file as binary
+BINARY_SNIFF_BYTES = 8000
+
+def is_binary(data):
+    # data: bytes or str (decoded content keeps NUL bytes)
+    return (b"\0" if isinstance(data, bytes) else "\0") in data[:BINARY_SNIFF_BYTES]
+
+def git_blob_info(rev, file_paths, cwd=None):
+    # Blob SHA and size for many "rev:path" names from a single "git cat-file --batch-check",
+    # without reading any content: {path: (sha, size)}, None for missing paths
+    result = {}
+    specs = []
+    for file_path in file_paths:
+        if "\n" in file_path:
+            # --batch-check is line oriented; such paths are treated as unknown
+            result[file_path] = None
+        else:
+            specs.append(file_path)
+    if not specs:
+        return result
+    output = run_git_command(["cat-file", "--batch-check"], cwd=cwd,
+                             input="".join(f"{rev}:{file_path}\n" for file_path in specs))
+    for file_path, line in zip(specs, output.splitlines()):
+        parts = line.split()
+        # "<spec> missing" / "<spec> ambiguous" for unresolvable names; the spec itself may contain spaces
+        if parts[-1] not in ("missing", "ambiguous") and len(parts) == 3 and parts[1] == "blob":
+            result[file_path] = (parts[0], int(parts[2]))
+        else:
+            result[file_path] = None
+    return result
+
+class BlobInfoCache:
+    # get_blob_info(rev, file_paths) backed by one "git cat-file --batch-check" per rev for all
+    # candidate paths, so that loading files does not spawn a process just to learn their sizes
+    def __init__(self, file_paths, cwd=None):
+        self.file_paths = list(file_paths)
+        self.cwd = cwd
+        self._infos = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, rev, file_paths):
+        with self._lock:
+            infos = self._infos.get(rev)
+            if infos is None:
+                infos = self._infos[rev] = git_blob_info(rev, self.file_paths, cwd=self.cwd)
+            unknown = [file_path for file_path in file_paths if file_path not in infos]
+            if unknown:
+                infos.update(git_blob_info(rev, unknown, cwd=self.cwd))
+            return {file_path: infos[file_path] for file_path in file_paths}
+
+class GitBlobReader:
+    # Long-lived "git cat-file --batch" process serving many "rev:path" reads over one pipe
+    def __init__(self, cwd=None):
+        self.cwd = cwd
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _ensure_process(self):
+        if self._process is None or self._process.poll() is not None:
+            count("git.spawn")
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                cwd=self.cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        return self._process
+
+    def _request(self, process, spec, max_bytes=None):
+        process.stdin.write(spec.encode("utf-8") + b"\n")
+        process.stdin.flush()
+        header = process.stdout.readline()
+        if not header:
+            raise Exception(f"git cat-file --batch terminated while reading {spec}")
+        parts = header.split()
+        # "<spec> missing" / "<spec> ambiguous" for unresolvable names; the spec itself may contain spaces
+        if parts[-1] in (b"missing", b"ambiguous") or len(parts) != 3:
+            return None
+        object_type, size = parts[1], int(parts[2])
+        if max_bytes is None or size <= max_bytes:
+            data = process.stdout.read(size)
+        else:
+            # Only the head of a large object is kept, the rest is drained chunk by chunk
+            data = process.stdout.read(max_bytes)
+            remaining = size - max_bytes
+            while remaining > 0:
+                skipped = len(process.stdout.read(min(remaining, BLOB_READ_CHUNK)))
+                if not skipped:
+                    raise Exception(f"git cat-file --batch terminated while reading {spec}")
+                remaining -= skipped
+        process.stdout.read(1)  # trailing LF after object content
+        count("git.bytes_read", size)
+        if object_type != b"blob":
+            return None
+        return data
+
+    def read_blob(self, rev, file_path, max_bytes=None):
+        # Return raw bytes of rev:file_path (at most max_bytes of them) or None if it does not exist
+        if "\n" in file_path:
+            # --batch is line oriented, fall back to a one-off process
+            count("git.spawn")
+            try:
+                data = subprocess.run(["git", "show", f"{rev}:{file_path}"], cwd=self.cwd,
+                                      capture_output=True, check=True).stdout
+            except subprocess.CalledProcessError:
+                return None
+            return data if max_bytes is None else data[:max_bytes]
+        with self._lock:
+            process = self._ensure_process()
+            try:
+                with span("git cat-file --batch"):
+                    return self._request(process, f"{rev}:{file_path}", max_bytes)
+            except Exception:
+                # Broken pipe or protocol desync: restart the process on next read
+                self._kill()
+                raise
+
+    def read_file(self, rev, file_path):
+        data = self.read_blob(rev, file_path)
+        if data is None:
+            return ""
+        return data.decode("utf-8", errors="replace").strip()
+
+    def read_preview(self, rev, file_path, max_bytes):
+        # Head of a file that is too large to load: whole lines only, when there are any
+        data = self.read_blob(rev, file_path, max_bytes)
+        if data is None:
+            return ""
+        if len(data) == max_bytes and b"\n" in data:
+            data = data[:data.rindex(b"\n")]
+        return data.decode("utf-8", errors="replace")
+
+    def read_files(self, revs, file_paths):
+        # Bulk read: {rev: {file_path: content}} for every rev/path combination
+        result = {}
+        for rev in revs:
+            result[rev] = {file_path: self.read_file(rev, file_path) for file_path in file_paths}
+        return result
+
+    def _kill(self):
+        if self._process is not None:
+            try:
+                self._process.kill()
+                self._process.wait()
+            except Exception:
+                pass
+            self._process = None
+
+    def close(self):
+        with self._lock:
+            if self._process is None:
+                return
+            try:
+                self._process.stdin.close()
+                self._process.wait(timeout=5)
+            except Exception:
+                self._kill()
+            self._process = None
+
+
+_blob_readers = {}
+_blob_readers_lock = threading.Lock()
+
+def get_blob_reader(cwd=None):
+    # One reader per repository path, shared by all callers
+    key = os.path.abspath(cwd or ".")
+    with _blob_readers_lock:
+        reader = _blob_readers.get(key)
+        if reader is None:
+            reader = _blob_readers[key] = GitBlobReader(cwd=key)
+        return reader
+
+def close_blob_readers():
+    with _blob_readers_lock:
+        readers = list(_blob_readers.values())
+        _blob_readers.clear()
+    for reader in readers:
+        reader.close()
+
+atexit.register(close_blob_readers)
 
 def read_file_at_branch(branch, file_path):
     try:
-        content = run_git_command(["show", f"{branch}:{file_path}"])
-        return content
+        return get_blob_reader().read_file(branch, file_path)
     except Exception:
         return ""
 
+def read_preview_at_branch(branch, file_path, max_bytes):
+    try:
+        return get_blob_reader().read_preview(branch, file_path, max_bytes)
+    except Exception:
+        return ""
+
+def read_files_at_branches(branches, file_paths):
+    # Bulk variant of read_file_at_branch: {branch: {file_path: content}}
+    try:
+        return get_blob_reader().read_files(branches, file_paths)
+    except Exception:
+        return {branch: {f: read_file_at_branch(branch, f) for f in file_paths} for branch in branches}
+
 def git_restore_file_from_branch(file_path, branch):
     # Restore file content from branch (discard changes)
     run_git_command(["restore", "--source", branch, "--", file_path])
 
+def git_restore_files_from_branch(file_paths, branch, cwd=None, worktree=True):
+    # Restore many files from branch with a single "git restore"; paths missing in branch are removed
+    if not file_paths:
+        return
+    args = ["--literal-pathspecs", "restore", "--source", branch, "--staged"]
+    if worktree:
+        args.append("--worktree")
+    args += ["--pathspec-from-file=-", "--pathspec-file-nul"]
+    run_git_command(args, cwd=cwd, input="\0".join(file_paths) + "\0")
+
+def git_hash_files(file_paths, cwd=None):
+    # Write files into the object store with a single "git hash-object"; returns blob SHAs in order
+    if not file_paths:
+        return []
+    output = run_git_command(["hash-object", "-w", "--stdin-paths"], cwd=cwd, input="\n".join(file_paths) + "\n")
+    return output.splitlines()
+
+def git_update_local_branch(branch):
+    # Fast-forward a local branch to origin without checking it out.
+    # git refuses this for the branch checked out in the main worktree; that one is left as is.
+    try:
+        run_git_command(["fetch", "origin", f"{branch}:{branch}"])
+        return True
+    except Exception:
+        return False
+
+_WORKTREE_PREFIX = "git_utils_worktree_"
+
+class IndexWorkspace:
+    # Builds a branch in a temporary "git worktree" through its index only: the worktree
+    # is created without checkout, the index is filled with read-tree, and every change
+    # is a blob written to the object store plus an index entry. Neither the main checkout
+    # nor the files of the repository are touched; disk I/O scales with the changed files.
+    def __init__(self, base, branch, cwd=None):
+        self.base = base
+        self.branch = branch
+        self.cwd = cwd
+        self.path = None
+
+    def create(self):
+        self._remove_stale_worktree()
+        self.path = tempfile.mkdtemp(prefix=_WORKTREE_PREFIX)
+        # -B resets the branch to base if it already exists
+        run_git_command(["worktree", "add", "--no-checkout", "-f", "-B", self.branch, self.path, self.base],
+                        cwd=self.cwd)
+        run_git_command(["read-tree", self.base], cwd=self.path)
+        return self
+
+    def _remove_stale_worktree(self):
+        # A crashed run leaves its temporary worktree registered with the branch checked out,
+        # and "worktree add -B" then refuses the branch. Only our own temporary worktrees are removed.
+        run_git_command(["worktree", "prune"], cwd=self.cwd)
+        path = None
+        for line in run_git_command(["worktree", "list", "--porcelain"], cwd=self.cwd).splitlines():
+            if line.startswith("worktree "):
+                path = line[len("worktree "):]
+            elif (line == f"branch refs/heads/{self.branch}" and path is not None
+                  and os.path.basename(path).startswith(_WORKTREE_PREFIX)):
+                run_git_command(["worktree", "remove", "--force", path], cwd=self.cwd)
+
+    def set_entries(self, entries):
+        # entries: (mode, sha, path); sha None removes the path from the index
+        lines = []
+        for mode, sha, file_path in entries:
+            if sha is None:
+                lines.append(f"0 {_NULL_SHA}\t{file_path}")
+            else:
+                lines.append(f"{mode} {sha}\t{file_path}")
+        if lines:
+            run_git_command(["update-index", "--index-info"], cwd=self.path, input="\n".join(lines) + "\n")
+
+    def restore_paths(self, source, file_paths):
+        git_restore_files_from_branch(file_paths, source, cwd=self.path, worktree=False)
+
+    def write_contents(self, contents):
+        # contents: {path: (content, mode)}. Contents go through temporary files so that
+        # all blobs are written by one hash-object and staged by one update-index
+        if not contents:
+            return
+        with tempfile.TemporaryDirectory(prefix="git_utils_blobs_") as tmp:
+            tmp_paths = []
+            for i, (content, _) in enumerate(contents.values()):
+                tmp_path = os.path.join(tmp, str(i))
+                with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                    f.write(content)
+                tmp_paths.append(tmp_path)
+            shas = git_hash_files(tmp_paths, cwd=self.path)
+        self.set_entries([(mode, sha, file_path) for (file_path, (_, mode)), sha in zip(contents.items(), shas)])
+
+    def commit(self, message):
+        run_git_command(["commit", "-m", message], cwd=self.path)
+
+    def remove(self):
+        if self.path is not None:
+            try:
+                run_git_command(["worktree", "remove", "--force", self.path], cwd=self.cwd)
+            except Exception:
+                shutil.rmtree(self.path, ignore_errors=True)
+                run_git_command(["worktree", "prune"], cwd=self.cwd)
+            self.path = None
+
 def git_commit_all(message):
     # Stage the file and commit
-    run_git_command(["add ."])
+    run_git_command(["add", "."])
     run_git_command(["commit", "-m", message])
\ No newline at end of file
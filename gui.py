@@ -1,13 +1,38 @@
-import difflib
+import bisect
+import queue
+import threading
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox, simpledialog, scrolledtext
 
 from git_utils import git_commit_all
-from ch_format import format_sql_with_clickhouse_format as format_sql
+from diff_engine import diff_rows
+from file_features import FileFeatures, is_hidden
+from profiling import PROFILER, span
+from session_cache import DEFAULT_PREFETCH_DEPTH, PREVIEW_BYTES, Prefetcher, SessionCache
+
+# Фоновая классификация: число потоков, размер пачки файлов и период опроса очереди
+CLASSIFY_WORKERS = 4
+CLASSIFY_CHUNK_SIZE = 50
+CLASSIFY_POLL_MS = 50
+
+# Сравнение: строк в одной порции отрисовки и строк контекста в свернутом режиме
+COMPARE_CHUNK_LINES = 2000
+COMPARE_CONTEXT_LINES = 3
+
+# Поток Tk ждет информацию о коммитах не дольше этого (секунды), дальше подписи
+# обновляются опросом: обход истории может еще не дойти до старого файла
+COMMIT_INFO_WAIT_SECONDS = 0.05
+COMMIT_INFO_POLL_MS = 200
+
+# Период обновления строки счетчиков профайлера (--profile)
+PROFILE_STATUS_MS = 1000
 
 
 class MergeToolGUI(tk.Tk):
-    def __init__(self, files, branch1_name, branch2_name, branch3_name, get_content_func, get_commit_info_func, on_choose_version):
+    def __init__(self, files, branch1_name, branch2_name, branch3_name, get_content_func, get_commit_info_func, on_choose_version,
+                 get_contents_func=None, get_blob_id_func=None, session_cache=None,
+                 prefetch_depth=DEFAULT_PREFETCH_DEPTH, on_commit=None):
         super().__init__()
         self.title(f"Merge Tool: {branch1_name} vs {branch2_name} into {branch3_name}")
         self.geometry("1000x700")
@@ -19,8 +44,28 @@ class MergeToolGUI(tk.Tk):
         self.branch3 = branch3_name
         self.get_content = get_content_func
         self.get_commit_info = get_commit_info_func
+        # Кэш сравнений файлов на сессию: содержимое, форматирование, дифф, коммиты
+        if session_cache is None:
+            session_cache = SessionCache(branch1_name, branch2_name, get_content_func, get_commit_info_func,
+                                         get_contents=get_contents_func, get_blob_id=get_blob_id_func)
+        self.session = session_cache
+        # Прогрев соседних файлов списка, пока открыт текущий
+        self.prefetcher = Prefetcher(self.session, depth=prefetch_depth)
         self.on_choose_version = on_choose_version
+        # Коммит результата: по умолчанию все изменения рабочей копии
+        self.on_commit = on_commit or git_commit_all
         self.selected_file = None
+        # Для двоичных и больших файлов ("binary" / "large") показывается только начало
+        self.selected_kind = None
+        # Файл, для которого идет опрос информации о коммитах (poll_commit_info)
+        self.commit_info_poll_file = None
+
+        # Строка счетчиков внизу окна, только при включенном профайлере
+        self.label_profile = None
+        if PROFILER.enabled:
+            self.label_profile = ttk.Label(self, text="", anchor='w', relief=tk.SUNKEN)
+            self.label_profile.pack(side=tk.BOTTOM, fill=tk.X)
+            self.after(PROFILE_STATUS_MS, self.update_profile_status)
 
         # Слева Frame для списка файлов и чекбоксов
         left_frame = ttk.Frame(self)
@@ -44,6 +89,14 @@ class MergeToolGUI(tk.Tk):
                                                  command=self.on_files_filter_change)
         self.checkbox_hide_drop.pack(anchor='w', pady=2)
 
+        # Прогресс фоновой классификации файлов
+        self.progress = ttk.Progressbar(left_frame, mode='determinate')
+        self.progress.pack(fill=tk.X, pady=(5, 0))
+        self.label_progress = ttk.Label(left_frame, text="")
+        self.label_progress.pack(anchor='w')
+        self.btn_cancel = ttk.Button(left_frame, text="Отмена", command=self.on_cancel_classification)
+        self.btn_cancel.pack(anchor='w', pady=2)
+
         # Правый Frame
         right_frame = ttk.Frame(self)
         right_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -90,25 +143,50 @@ class MergeToolGUI(tk.Tk):
         self.label_compare = ttk.Label(right_frame, text="Сравнение файлов", font=('TkDefaultFont', 10, 'bold'))
         self.label_compare.pack(anchor="w", padx=5)
 
+        self.var_collapse_same = tk.BooleanVar(value=False)
+        self.checkbox_collapse_same = ttk.Checkbutton(right_frame, text="сворачивать совпадающие строки",
+                                                      variable=self.var_collapse_same,
+                                                      command=self.render_file_comparison)
+        self.checkbox_collapse_same.pack(anchor="w", padx=5)
+
         # Новый текстовый блок для сравнения сразу
         self.text_compare = scrolledtext.ScrolledText(right_frame, height=15, wrap='none')
         self.text_compare.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 10))
+        self.text_compare.config(yscrollcommand=self.on_compare_scroll)
+        self.text_compare.tag_config('deleted', background='red', foreground='white')
+        self.text_compare.tag_config('added', background='green', foreground='white')
+        self.text_compare.tag_config('moved', background='#3b6ea5', foreground='white')
+        self.text_compare.tag_config('collapsed', foreground='gray')
+        self.compare_lines = ([], [], [])
+        self.compare_notice = None
+        self.compare_rows = []
+        self.compare_rendered = 0
+        self.compare_fill_pending = False
 
         # Коммит кнопка
         self.btn_commit = ttk.Button(right_frame, text="Commit all", command=self.gui_commit_all)
         self.btn_commit.pack(pady=5)
 
+        # Классификация файлов идет в фоне, результаты приходят через очередь
+        self.classify_executor = ThreadPoolExecutor(max_workers=CLASSIFY_WORKERS, thread_name_prefix="classify")
+        self.classify_queue = queue.Queue()
+        self.classify_generation = 0
+        self.classify_cancel = threading.Event()
+        self.classify_futures = []
+        self.classify_done_count = 0
+        self.auto_select = True
+        # Признаки отличий по файлам: вычисляются один раз, фильтры применяются к ним мгновенно
+        self.features = {}
+        self.file_order = {f: i for i, f in enumerate(self.original_files)}
+        self.filtered_order = []
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # Изначально активируем/деактивируем чекбоксы правильно
         self.update_drop_checkbox_state()
 
         # Заполнить список с фильтрацией
         self.apply_files_filter()
 
-        # Если есть файлы после фильтрации выбираем первый
-        if self.filtered_files:
-            self.file_listbox.selection_set(0)
-            self.load_file_content(self.filtered_files[0])
-
     def on_checkbox_hide_same_toggle(self):
         self.update_drop_checkbox_state()
         self.apply_files_filter()
@@ -123,56 +201,171 @@ class MergeToolGUI(tk.Tk):
     def on_files_filter_change(self):
         self.apply_files_filter()
 
+    def active_filters(self):
+        filters = []
+        if self.var_hide_same.get():
+            filters.append("hide_same")
+        if self.var_hide_drop.get():
+            filters.append("hide_drop")
+        return filters
+
     def apply_files_filter(self):
-        # Фильтрация списка файлов в зависимости от чекбоксов
-        filtered = []
+        # Фильтрация списка файлов в зависимости от чекбоксов.
+        # Уже классифицированные файлы фильтруются сразу по признакам в памяти,
+        # остальные обрабатываются в фоне и появляются в списке по мере готовности.
+        active = self.active_filters()
+        self.auto_select = True
+        self.filtered_files = []
+        self.filtered_order = []
+        self.file_listbox.delete(0, tk.END)
+        self.clear_file_view()
         for f in self.original_files:
-            # Получаем содержимое файлов для сравнения
-            content1 = self.get_content(self.branch1, f)
-            content2 = self.get_content(self.branch2, f)
-
-            # Форматируем тексты и разбиваем
-            text1 = format_sql(content1).splitlines()
-            text2 = format_sql(content2).splitlines()
-
-            diff = list(difflib.ndiff(text1, text2))
+            features = self.features.get(f)
+            if features is not None and not is_hidden(features, active):
+                self.filtered_order.append(self.file_order[f])
+                self.filtered_files.append(f)
+        self.file_listbox.insert(tk.END, *self.filtered_files)
+        if self.filtered_files:
+            self.auto_select = False
+            self.file_listbox.selection_set(0)
+            self.load_file_content(self.filtered_files[0])
 
-            # Проверяем отличие
-            has_diff = any(line.startswith('+') or line.startswith('-') for line in diff)
+        # Фоновая классификация еще не обработанных файлов (если она уже не идет)
+        if not self.classify_futures or self.classify_cancel.is_set():
+            self.start_classification()
 
-            # Если "не показывать совпадающие" включен, пропускаем если нет отличий
-            if self.var_hide_same.get() and not has_diff:
+    def start_classification(self):
+        files = [f for f in self.original_files if f not in self.features]
+        self.classify_futures = []
+        if not files:
+            self.finish_classification()
+            return
+        self.classify_generation += 1
+        self.classify_cancel = threading.Event()
+        self.classify_done_count = len(self.features)
+
+        chunks = [files[i:i + CLASSIFY_CHUNK_SIZE] for i in range(0, len(files), CLASSIFY_CHUNK_SIZE)]
+        self.classify_futures = [
+            self.classify_executor.submit(self.classify_chunk, chunk, self.classify_generation, self.classify_cancel)
+            for chunk in chunks
+        ]
+        self.progress.config(maximum=max(len(self.original_files), 1), value=self.classify_done_count)
+        self.label_progress.config(text=f"Обработано {self.classify_done_count} из {len(self.original_files)}")
+        self.btn_cancel.state(['!disabled'])
+        self.after(CLASSIFY_POLL_MS, self.poll_classification, self.classify_generation)
+
+    def classify_chunk(self, chunk, generation, cancel_event):
+        # Выполняется в рабочем потоке: не трогает виджеты, только кладет результат в очередь
+        if cancel_event.is_set():
+            return
+        try:
+            comparisons = self.session.get_many(chunk, with_diff=True)
+            results = []
+            for f in chunk:
+                if cancel_event.is_set():
+                    return
+                results.append((f, comparisons[f].features))
+        except Exception as e:
+            # Файлы, которые не удалось обработать, показываем как отличающиеся
+            print(f"Ошибка обработки файлов: {e}")
+            results = [(f, FileFeatures(has_diff=True)) for f in chunk]
+        self.classify_queue.put((generation, results))
+
+    def poll_classification(self, generation):
+        if generation != self.classify_generation:
+            return
+        active = self.active_filters()
+        while True:
+            try:
+                item_generation, results = self.classify_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item_generation != generation:
                 continue
-
-            # Если "не показывать DROP'ы" включен, пропускаем если в отличиях есть DROP или пустые строки
-            if self.var_hide_drop.get():
-                diff_lines = [line for line in diff if line.startswith('+') or line.startswith('-')]
-                # Проверяем наличие "DROP" или пустых различий
-                if any((('DROP' in line.upper()) or (line.strip() in {'+', '-', '+ ', '- ', ''})) for line in diff_lines):
+            for f, features in results:
+                if f in self.features:
                     continue
-
-            filtered.append(f)
-
-        # Обновляем список файлов на экране
-        self.filtered_files = filtered
-        self.file_listbox.delete(0, tk.END)
-        for f in self.filtered_files:
-            self.file_listbox.insert(tk.END, f)
-
+                self.features[f] = features
+                self.classify_done_count += 1
+                if not is_hidden(features, active):
+                    self.add_filtered_file(f)
+
+        total = len(self.original_files)
+        self.progress.config(value=self.classify_done_count)
+        self.label_progress.config(text=f"Обработано {self.classify_done_count} из {total}")
+        if self.classify_done_count >= total:
+            self.classify_futures = []
+            self.finish_classification()
+        elif not self.classify_cancel.is_set():
+            self.after(CLASSIFY_POLL_MS, self.poll_classification, generation)
+
+    def add_filtered_file(self, f):
+        # Вставляем файл, сохраняя исходный порядок списка
+        order = self.file_order[f]
+        index = bisect.bisect(self.filtered_order, order)
+        self.filtered_order.insert(index, order)
+        self.filtered_files.insert(index, f)
+        self.file_listbox.insert(index, f)
+        # Первый подходящий файл сразу открываем для просмотра
+        if self.auto_select:
+            self.auto_select = False
+            self.file_listbox.selection_clear(0, tk.END)
+            self.file_listbox.selection_set(index)
+            self.load_file_content(f)
+
+    def finish_classification(self):
+        self.btn_cancel.state(['disabled'])
+        self.progress.config(value=self.classify_done_count)
+        if self.classify_cancel.is_set():
+            self.label_progress.config(
+                text=f"Отменено: обработано {self.classify_done_count} из {len(self.original_files)}")
+        else:
+            self.label_progress.config(text=f"Обработано {self.classify_done_count} из {len(self.original_files)}")
         # Если список пуст, очистить текстовые поля
         if not self.filtered_files:
-            self.selected_file = None
-            self.text_branch1.delete(1.0, tk.END)
-            self.text_branch2.delete(1.0, tk.END)
-            self.label_branch1.config(text="")
-            self.label_branch2.config(text="")
-            self.label_status.config(text="")
-            self.text_compare.delete(1.0, tk.END)
-        else:
-            # Автоматически выбрать первый файл
-            self.file_listbox.selection_clear(0, tk.END)
-            self.file_listbox.selection_set(0)
-            self.load_file_content(self.filtered_files[0])
+            self.clear_file_view()
+
+    def cancel_classification(self):
+        self.classify_cancel.set()
+        for future in self.classify_futures:
+            future.cancel()
+        self.classify_futures = []
+
+    def on_cancel_classification(self):
+        self.cancel_classification()
+        self.finish_classification()
+
+    def on_close(self):
+        self.cancel_classification()
+        self.classify_executor.shutdown(wait=False, cancel_futures=True)
+        self.prefetcher.close()
+        self.destroy()
+
+    def update_profile_status(self):
+        mb = PROFILER.counter("git.bytes_read") / (1024 * 1024)
+        self.label_profile.config(text=(
+            f"git: {PROFILER.counter('git.spawn')} запусков, {mb:.1f} МБ, {PROFILER.total_ms('git '):.0f} мс"
+            f" | clickhouse-format: {PROFILER.counter('format.spawn')} запусков,"
+            f" {PROFILER.total_ms('clickhouse-format'):.0f} мс, кэш {PROFILER.hit_rate('format_cache'):.0%}"
+            f" | дифф: {PROFILER.total_ms('diff '):.0f} мс"
+            f" | отрисовка: {PROFILER.total_ms('gui.'):.0f} мс"))
+        self.after(PROFILE_STATUS_MS, self.update_profile_status)
+
+    def clear_file_view(self):
+        self.selected_file = None
+        self.selected_kind = None
+        self.text_branch1.delete(1.0, tk.END)
+        self.text_branch2.config(state=tk.NORMAL)
+        self.text_branch2.delete(1.0, tk.END)
+        self.label_branch1.config(text="")
+        self.label_branch2.config(text="")
+        self.label_status.config(text="")
+        self.text_compare.config(state=tk.NORMAL)
+        self.text_compare.delete(1.0, tk.END)
+        self.compare_lines = ([], [], [])
+        self.compare_notice = None
+        self.compare_rows = []
+        self.compare_rendered = 0
 
     def on_file_selected(self, event):
         selection = self.file_listbox.curselection()
@@ -183,61 +376,127 @@ class MergeToolGUI(tk.Tk):
     def load_file_content(self, file_name):
         self.selected_file = file_name
 
-        content1 = self.get_content(self.branch1, file_name)
-        content2 = self.get_content(self.branch2, file_name)
-        info1 = self.get_commit_info(self.branch1, file_name)
-        info2 = self.get_commit_info(self.branch2, file_name)
+        comparison = self.session.get(file_name, info_timeout=COMMIT_INFO_WAIT_SECONDS)
+        self.selected_kind = comparison.kind
+        content1, content2 = comparison.content1, comparison.content2
+        self.show_commit_info(file_name, comparison)
+        if comparison.info1 is None and self.commit_info_poll_file != file_name:
+            self.commit_info_poll_file = file_name
+            self.after(COMMIT_INFO_POLL_MS, self.poll_commit_info, file_name)
 
-        label1 = f"{file_name} | {info1['date']} | {info1['author']}" if info1['author'] else file_name
-        label2 = f"{file_name} | {info2['date']} | {info2['author']}" if info2['author'] else file_name
-
-        self.label_branch1.config(text=label1)
-        self.label_branch2.config(text=label2)
-
-        if info1['author'] is None:
-            self.label_status.config(text="NEW FILE")
-        else:
-            self.label_status.config(text="MODIFIED")
-
-        self.text_branch1.config(state=tk.NORMAL)
-        self.text_branch1.delete(1.0, tk.END)
-        self.text_branch1.insert(tk.END, content1)
-        self.text_branch1.config(state=tk.NORMAL)
+        with span("gui.insert_text", path=file_name):
+            self.text_branch1.config(state=tk.NORMAL)
+            self.text_branch1.delete(1.0, tk.END)
+            self.text_branch1.insert(tk.END, content1)
+            self.text_branch1.config(state=tk.NORMAL)
 
-        self.text_branch2.config(state=tk.NORMAL)
-        self.text_branch2.delete(1.0, tk.END)
-        self.text_branch2.insert(tk.END, content2)
-        self.text_branch2.config(state=tk.NORMAL)
+            self.text_branch2.config(state=tk.NORMAL)
+            self.text_branch2.delete(1.0, tk.END)
+            self.text_branch2.insert(tk.END, content2)
+        # Начало файла нельзя редактировать и сохранять как версию branch2
+        self.text_branch2.config(state=tk.NORMAL if comparison.kind is None else tk.DISABLED)
 
         # Вывести сравнение сразу при загрузке файла в text_compare
-        self.update_file_comparison(content1, content2)
-
-    def update_file_comparison(self, text1_raw, text2_raw):
-        # Форматирование
-        text1 = format_sql(text1_raw).splitlines()
-        text2 = format_sql(text2_raw).splitlines()
-
-        diff = difflib.ndiff(text1, text2)
+        self.update_file_comparison(comparison)
+
+        # Пока файл читают, готовим соседние
+        if file_name in self.filtered_files:
+            self.prefetcher.prefetch_around(self.filtered_files, self.filtered_files.index(file_name))
+
+    def show_commit_info(self, file_name, comparison):
+        info1, info2 = comparison.info1, comparison.info2
+        if info1 is None:
+            # Информация о коммитах еще не готова: подписи обновит poll_commit_info
+            self.label_branch1.config(text=f"{file_name} | загрузка...")
+            self.label_branch2.config(text=f"{file_name} | загрузка...")
+            status = "..."
+        else:
+            label1 = f"{file_name} | {info1['date']} | {info1['author']}" if info1['author'] else file_name
+            label2 = f"{file_name} | {info2['date']} | {info2['author']}" if info2['author'] else file_name
+            self.label_branch1.config(text=label1)
+            self.label_branch2.config(text=label2)
+            status = "NEW FILE" if info1['author'] is None else "MODIFIED"
+        if comparison.kind is not None:
+            status += f" | {comparison.kind.upper()}"
+        self.label_status.config(text=status)
+
+    def poll_commit_info(self, file_name):
+        if file_name != self.selected_file:
+            self.commit_info_poll_file = None
+            return
+        comparison = self.session.get_many([file_name], with_info=True, info_timeout=0)[file_name]
+        if comparison.info1 is None:
+            self.after(COMMIT_INFO_POLL_MS, self.poll_commit_info, file_name)
+            return
+        self.commit_info_poll_file = None
+        self.show_commit_info(file_name, comparison)
+
+    def update_file_comparison(self, comparison):
+        # Отформатированные строки и дифф берутся из кэша сессии
+        self.compare_lines = (comparison.lines1, comparison.lines2, comparison.compute_diff())
+        self.compare_notice = self.skipped_notice(comparison) if comparison.kind is not None else None
+        self.render_file_comparison()
+
+    def skipped_notice(self, comparison):
+        # Двоичные и большие файлы не сравниваются построчно, вердикт - по blob ID
+        if comparison.kind == "binary":
+            lines = ["Двоичный файл: форматирование и сравнение пропущены"]
+        else:
+            lines = [f"Большой файл: показано начало ({PREVIEW_BYTES // 1024} КБ), "
+                     f"форматирование и сравнение пропущены"]
+        lines.append(f"Размер: {comparison.blob_size1} / {comparison.blob_size2} байт")
+        lines.append("Содержимое по blob ID: " + ("различается" if comparison.features.has_diff else "совпадает"))
+        return lines
+
+    def render_file_comparison(self):
+        # Строки сравнения готовятся целиком, а в виджет попадают порциями:
+        # сначала видимая часть с запасом, остальное - по мере прокрутки
+        text1, text2, opcodes = self.compare_lines
+        context = COMPARE_CONTEXT_LINES if self.var_collapse_same.get() else None
+        if self.compare_notice is not None:
+            self.compare_rows = [(line, None) for line in self.compare_notice]
+        else:
+            with span("gui.diff_rows"):
+                self.compare_rows = list(diff_rows(text1, text2, opcodes, context))
+        self.compare_rendered = 0
 
         # Очищаем предыдущее содержимое
         self.text_compare.config(state=tk.NORMAL)
         self.text_compare.delete(1.0, tk.END)
-
-        for line in diff:
-            if line.startswith("-"):
-                self.text_compare.insert(tk.END, line + "\n", 'deleted')
-            elif line.startswith("+"):
-                self.text_compare.insert(tk.END, line + "\n", 'added')
-            elif line.startswith("?"):
-                # Пропускаем линии подсветки символов различий
-                continue
-            else:
-                self.text_compare.insert(tk.END, line + "\n")
-
-        self.text_compare.tag_config('deleted', background='red', foreground='white')
-        self.text_compare.tag_config('added', background='green', foreground='white')
-
         self.text_compare.config(state=tk.DISABLED)
+        self.render_compare_chunk()
+
+    def render_compare_chunk(self):
+        self.compare_fill_pending = False
+        start = self.compare_rendered
+        chunk = self.compare_rows[start:start + COMPARE_CHUNK_LINES]
+        if not chunk:
+            return
+        self.compare_rendered += len(chunk)
+
+        # Один insert на порцию, теги - одним tag_add на тег с объединенными диапазонами
+        ranges = {}
+        run_tag, run_start = None, None
+        for k, (_, tag) in enumerate(chunk + [("", None)]):
+            if tag != run_tag:
+                if run_tag is not None:
+                    ranges.setdefault(run_tag, []).extend((f"{start + run_start + 1}.0", f"{start + k + 1}.0"))
+                run_tag, run_start = tag, k
+
+        with span("gui.render_chunk", lines=len(chunk)):
+            self.text_compare.config(state=tk.NORMAL)
+            self.text_compare.insert(tk.END, "".join(line + "\n" for line, _ in chunk))
+            for tag, indexes in ranges.items():
+                self.text_compare.tag_add(tag, *indexes)
+            self.text_compare.config(state=tk.DISABLED)
+
+    def on_compare_scroll(self, first, last):
+        self.text_compare.vbar.set(first, last)
+        # Подгружаем следующую порцию, когда прокрутили близко к концу отрисованного
+        if (float(last) > 0.9 and not self.compare_fill_pending
+                and self.compare_rendered < len(self.compare_rows)):
+            self.compare_fill_pending = True
+            self.after_idle(self.render_compare_chunk)
 
     def leave_branch1(self):
         if not self.selected_file:
@@ -247,7 +506,8 @@ class MergeToolGUI(tk.Tk):
         # Удаляем файл из списка
         if self.selected_file in self.filtered_files:
             index = self.filtered_files.index(self.selected_file)
-            self.filtered_files.remove(self.selected_file)
+            del self.filtered_files[index]
+            del self.filtered_order[index]
             self.file_listbox.delete(index)
             self.selected_file = None
             messagebox.showinfo("Сохранено", f"Выбрана версия из {self.branch1}")
@@ -256,7 +516,8 @@ class MergeToolGUI(tk.Tk):
         if not self.selected_file:
             messagebox.showerror("Ошибка", "Файл не выбран")
             return
-        content = self.text_branch2.get(1.0, tk.END)
+        # Для двоичных и больших файлов в поле только начало: берется blob из branch2 без изменений
+        content = self.text_branch2.get(1.0, tk.END) if self.selected_kind is None else None
         self.on_choose_version(self.selected_file, self.branch2, content)
         messagebox.showinfo("Сохранено", f"Выбрана версия из {self.branch2}")
 
@@ -265,4 +526,4 @@ class MergeToolGUI(tk.Tk):
         if commit_message is None or commit_message.strip() == "":
             messagebox.showerror("Ошибка", "Комментарий к коммиту обязателен")
             return
-        git_commit_all(commit_message)
\ No newline at end of file
+        self.on_commit(commit_message)
\ No newline at end of file
@@ -2,70 +2,198 @@ import argparse
 import sys
 import os
 from git_utils import *
-from gui import MergeToolGUI
+from format_cache import close_format_cache
+from session_cache import DEFAULT_PREFETCH_DEPTH, SessionCache
+from report import iter_report, write_report
+from decision_journal import DecisionJournal
+from profiling import PROFILER
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Git merge helper tool")
     parser.add_argument("--branch1", required=True, help="Name of branch1")
     parser.add_argument("--branch2", required=True, help="Name of branch2")
-    parser.add_argument("--branch3", required=True, help="Name of new branch3")
-    return parser.parse_args()
+    parser.add_argument("--branch3", help="Name of new branch3 (required unless --report)")
+    parser.add_argument("--prefetch-depth", type=int, default=DEFAULT_PREFETCH_DEPTH,
+                        help="Number of neighbouring files to prepare in the background")
+    parser.add_argument("--worktree", action="store_true",
+                        help="Build branch3 in a temporary worktree index without touching the current checkout")
+    parser.add_argument("--report", action="store_true",
+                        help="Classify files without GUI and stream one record per file")
+    parser.add_argument("--report-format", choices=["ndjson", "json"], default="ndjson",
+                        help="Report output format")
+    parser.add_argument("--output", help="Write the report to this file instead of stdout")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Number of parallel classification workers in report mode")
+    parser.add_argument("--profile", action="store_true",
+                        help="Count git/clickhouse-format calls and time hot paths, print a summary on exit")
+    parser.add_argument("--profile-trace", metavar="PATH",
+                        help="With profiling, also write a Chrome trace JSON to PATH (implies --profile)")
+    args = parser.parse_args()
+    if not args.report and not args.branch3:
+        parser.error("--branch3 is required unless --report is given")
+    return args
+
+def run_report(args):
+    # Headless mode: branches are only read, the working tree is not touched
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        count = write_report(iter_report(args.branch1, args.branch2, jobs=args.jobs), out, args.report_format)
+    finally:
+        if args.output:
+            out.close()
+        close_blob_readers()
+        close_format_cache()
+    print(f"Обработано файлов: {count}", file=sys.stderr)
 
 def main():
     args = parse_args()
+    if not (args.profile or args.profile_trace):
+        run(args)
+        return
+    PROFILER.enable(trace=bool(args.profile_trace))
+    try:
+        run(args)
+    finally:
+        print(PROFILER.summary(), file=sys.stderr)
+        if args.profile_trace:
+            events = PROFILER.write_trace(args.profile_trace)
+            print(f"Chrome trace: {args.profile_trace} ({events} событий)", file=sys.stderr)
 
+def run(args):
     if not is_git_repo():
         print("Текущая директория не является git-репозиторием")
         sys.exit(1)
 
+    if args.report:
+        run_report(args)
+        return
+
     print("Fetching origin...")
     git_fetch_origin()
 
-    print(f"Checkout and pull {args.branch2}...")
-    git_checkout_branch(args.branch2)
-    git_pull(args.branch2)
-
-    print(f"Checkout and pull {args.branch1}...")
-    git_checkout_branch(args.branch1)
-    git_pull(args.branch1)
-
-    print(f"Creating branch {args.branch3}...")
-    git_checkout_branch(args.branch3, create_new=True, force_delete=True)
-
-    # print(f"Copying files from branch {args.branch1}...")
-    # copy_branch_files_to_workdir(args.branch1)
+    if args.worktree:
+        # The main checkout is never touched: branches are fast-forwarded in place
+        # and branch3 is built through the index of a temporary worktree
+        for branch in (args.branch2, args.branch1):
+            print(f"Updating {branch} from origin...")
+            if not git_update_local_branch(branch):
+                print(f"Ветка {branch} не обновлена из origin, используется локальная версия")
+    else:
+        print(f"Checkout and pull {args.branch2}...")
+        git_checkout_branch(args.branch2)
+        git_pull(args.branch2)
 
-    print(f"Copying changed files from branch {args.branch2}...")
-    checkout_different_files_from_branch2(args.branch2)
+        print(f"Checkout and pull {args.branch1}...")
+        git_checkout_branch(args.branch1)
+        git_pull(args.branch1)
 
-    modified_files = git_status_modified_files()
+    # Candidates are paths whose blob IDs differ between the branches; files deleted
+    # in branch2 are not brought over from it and are not reviewed
+    changes = {c["path"]: c for c in git_diff_blob_changes(args.branch1, args.branch2) if c["blob2"] is not None}
+    modified_files = list(changes)
     if not modified_files:
         print("Нет измененных файлов для обработки")
         sys.exit(0)
 
+    workspace = None
+    # Everything from here on runs under try/finally: a crash (no display, a broken journal...)
+    # must not leave the temporary worktree registered with branch3 checked out
+    try:
+        if args.worktree:
+            print(f"Creating branch {args.branch3} in a temporary worktree...")
+            workspace = IndexWorkspace(args.branch1, args.branch3)
+            workspace.create()
+            print(f"Staging changed files from branch {args.branch2}...")
+            workspace.set_entries([(c["mode2"], c["blob2"], path) for path, c in changes.items()])
+        else:
+            print(f"Creating branch {args.branch3}...")
+            git_checkout_branch(args.branch3, create_new=True, force_delete=True)
+
+            # print(f"Copying files from branch {args.branch1}...")
+            # copy_branch_files_to_workdir(args.branch1)
+
+            print(f"Copying changed files from branch {args.branch2}...")
+            checkout_different_files_from_branch2(args.branch2)
+
+        run_review(args, changes, workspace)
+    finally:
+        close_blob_readers()
+        close_format_cache()
+        if workspace is not None:
+            workspace.remove()
+
+def run_review(args, changes, workspace):
+    modified_files = list(changes)
+
     def get_content(branch, file_path):
         return read_file_at_branch(branch, file_path)
 
-    def get_commit_info(branch, file_path):
-        return get_file_last_commit_info(branch, file_path)
+    def get_contents(branch, file_paths):
+        return read_files_at_branches([branch], file_paths)[branch]
+
+    def get_blob_id(branch, file_path):
+        change = changes.get(file_path)
+        if change is None:
+            return None
+        return change["blob2"] if branch == args.branch2 else change["blob1"]
+
+    # Each index is asked only for paths that exist in its branch: a path it never sees
+    # (files added in branch2) would keep the walk going through the whole history
+    commit_indexes = {
+        branch: CommitInfoIndex(branch, [f for f in modified_files if get_blob_id(branch, f)]).start()
+        for branch in (args.branch1, args.branch2)
+    }
+
+    def get_commit_info(branch, file_path, timeout=None):
+        index = commit_indexes.get(branch)
+        if index is None:
+            return get_file_last_commit_info(branch, file_path)
+        if file_path in changes and file_path not in index:
+            return empty_commit_info()
+        return index.get(file_path, timeout=timeout)
+
+    session = SessionCache(args.branch1, args.branch2, get_content, get_commit_info,
+                           get_contents=get_contents, get_blob_id=get_blob_id,
+                           get_blob_info=BlobInfoCache(modified_files), get_preview=read_preview_at_branch)
+
+    # Choices are journaled (and persisted for resuming) and applied in bulk at commit time
+    journal = DecisionJournal(args.branch1, args.branch2, args.branch3)
+    resumed = journal.load()
+    if resumed:
+        print(f"Восстановлено решений из прерванной сессии: {resumed}")
+    # Files already taken from branch1 are not shown again, as after "Оставить из branch1"
+    taken_from_branch1 = set(journal.paths_for(args.branch1))
+    review_files = [f for f in modified_files if f not in taken_from_branch1]
 
     def on_choose_version(file_path, chosen_branch, content=None):
+        session.invalidate(file_path)
         if chosen_branch == args.branch1:
-            print(f'Восстанавливаем версию файла {file_path} из ветки {args.branch1}')
-            git_restore_file_from_branch(file_path, args.branch1)
+            print(f'Файл {file_path}: выбрана версия из ветки {args.branch1}')
+            journal.record(file_path, args.branch1)
         elif chosen_branch == args.branch2:
-            print(f'Записываем в файл {file_path}')
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(content)
-            
+            print(f'Файл {file_path}: выбрана отредактированная версия из ветки {args.branch2}')
+            # content is None for binary and oversized files: the branch2 blob is kept as is
+            journal.record(file_path, args.branch2, content, mode=changes[file_path]["mode2"])
+
+    def on_commit(message):
+        journal.apply_and_commit(message, workspace)
+
+    # tkinter is imported only for the GUI so that --report works without a display
+    from gui import MergeToolGUI
+
     app = MergeToolGUI(
-        files=modified_files,
+        files=review_files,
         branch1_name=args.branch1,
         branch2_name=args.branch2,
         branch3_name=args.branch3,
         get_content_func=get_content,
+        get_contents_func=get_contents,
+        get_blob_id_func=get_blob_id,
+        session_cache=session,
+        prefetch_depth=args.prefetch_depth,
         get_commit_info_func=get_commit_info,
-        on_choose_version=on_choose_version
+        on_choose_version=on_choose_version,
+        on_commit=on_commit
     )
     app.mainloop()
 
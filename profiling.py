@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# Границы корзин гистограммы задержек, мс (последняя корзина - все, что дольше)
+HISTOGRAM_BOUNDS_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+# Предел числа событий Chrome trace, чтобы долгая сессия не съела память
+TRACE_MAX_EVENTS = 500000
+
+# Классы размеров файлов для времени диффа, в строках
+DIFF_SIZE_CLASSES = (1000, 10000, 100000)
+
+_NULL_SPAN = nullcontext()
+
+
+class Timing:
+    """
+    Число вызовов, суммарное и максимальное время и гистограмма задержек одной операции.
+    """
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+        self.buckets[bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+
+    def percentile(self, fraction):
+        # Верхняя граница корзины, в которую попадает заданная доля вызовов
+        threshold = fraction * self.count
+        seen = 0
+        for bound, bucket in zip(HISTOGRAM_BOUNDS_MS, self.buckets):
+            seen += bucket
+            if seen >= threshold:
+                return min(bound, self.max)
+        return self.max
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start, self.start, self.args)
+        return False
+
+
+class Profiler:
+    """
+    Счетчики и таймеры горячих мест: запуски git и clickhouse-format, прочитанные байты,
+    попадания в кэш форматирования, дифф, отрисовка. Выключенный профайлер почти ничего не стоит:
+    span() возвращает общий пустой контекст, count() сразу возвращается.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.trace = False
+        self.counters = {}
+        self.timings = {}
+        self.events = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self, trace=False):
+        """
+        :param trace: Копить события для Chrome trace (write_trace)
+        """
+        self.enabled = True
+        self.trace = trace
+        self._origin = time.perf_counter()
+
+    def span(self, name, **args):
+        """
+        Контекст, замеряющий время блока: with profiler.span("git diff"): ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name, seconds, start=None, args=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = Timing()
+            timing.add(seconds)
+            if self.trace and start is not None and len(self.events) < TRACE_MAX_EVENTS:
+                self.events.append({
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start - self._origin) * 1e6,
+                    "dur": seconds * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args or {},
+                })
+
+    def counter(self, name):
+        return self.counters.get(name, 0)
+
+    def total_ms(self, prefix):
+        # Суммарное время всех операций, имя которых начинается с prefix
+        with self._lock:
+            return sum(t.total for name, t in self.timings.items() if name.startswith(prefix))
+
+    def hit_rate(self, prefix):
+        hits, misses = self.counter(prefix + ".hit"), self.counter(prefix + ".miss")
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def summary(self):
+        """
+        :return: Текстовая сводка счетчиков и времен для вывода при завершении
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items(), key=lambda item: -item[1].total)
+        lines = ["Профиль:"]
+        if counters:
+            if self.counter("format_cache.hit") or self.counter("format_cache.miss"):
+                counters.append(("format_cache.hit_rate", f"{self.hit_rate('format_cache'):.1%}"))
+            lines.append("  Счетчики:")
+            width = max(len(name) for name, _ in counters)
+            lines += [f"    {name:<{width}}  {value}" for name, value in counters]
+        if timings:
+            lines.append("  Время, мс:")
+            width = max(len(name) for name, _ in timings)
+            lines.append(f"    {'':<{width}}  {'вызовов':>8} {'всего':>10} {'среднее':>9} "
+                         f"{'p50<=':>7} {'p95<=':>7} {'макс':>9}")
+            for name, t in timings:
+                lines.append(f"    {name:<{width}}  {t.count:>8} {t.total:>10.1f} {t.total / t.count:>9.2f} "
+                             f"{t.percentile(0.5):>7.3g} {t.percentile(0.95):>7.3g} {t.max:>9.1f}")
+        if len(lines) == 1:
+            lines.append("  нет данных")
+        return "\n".join(lines)
+
+    def write_trace(self, path):
+        """
+        Записывает накопленные события в формате Chrome trace (chrome://tracing, Perfetto).
+        """
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return len(events)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+            self.events.clear()
+            self._origin = time.perf_counter()
+
+
+# Общий профайлер процесса, включается флагом --profile
+PROFILER = Profiler()
+
+
+def span(name, **args):
+    return PROFILER.span(name, **args)
+
+
+def count(name, value=1):
+    if PROFILER.enabled:
+        PROFILER.count(name, value)
+
+
+def diff_size_class(line_count):
+    """
+    Имя класса размера файла для времени диффа: "<1000", "<10000", ..., ">=100000" строк.
+    """
+    for bound in DIFF_SIZE_CLASSES:
+        if line_count < bound:
+            return f"<{bound}"
+    return f">={DIFF_SIZE_CLASSES[-1]}"
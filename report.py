@@ -0,0 +1,109 @@
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from git_utils import (BlobInfoCache, CommitInfoIndex, empty_commit_info, git_diff_blob_changes,
+                       read_file_at_branch, read_files_at_branches, read_preview_at_branch)
+from session_cache import SessionCache
+
+# Файлов в одной пачке классификации
+REPORT_CHUNK_SIZE = 50
+
+
+def _classify_chunk(session, changes):
+    comparisons = session.get_many([c["path"] for c in changes], with_diff=True, with_info=True)
+    records = []
+    for change in changes:
+        comparison = comparisons[change["path"]]
+        features = comparison.features
+        records.append({
+            "path": change["path"],
+            "status": change["status"],
+            "blob1": change["blob1"],
+            "blob2": change["blob2"],
+            "kind": comparison.kind or "text",
+            "size1": comparison.blob_size1,
+            "size2": comparison.blob_size2,
+            "differs": features.has_diff,
+            "has_drop": features.has_drop,
+            "has_blank": features.has_blank,
+            "blank_only": features.blank_only,
+            "format_error": any(lines and lines[0].startswith("Error: ")
+                                for lines in (comparison.lines1, comparison.lines2)),
+            "branch1_commit": comparison.info1,
+            "branch2_commit": comparison.info2,
+        })
+    return records
+
+
+def iter_report(branch1, branch2, jobs=None, chunk_size=REPORT_CHUNK_SIZE):
+    """
+    Классифицирует все отличающиеся файлы двух веток и отдает записи по мере готовности.
+    Память ограничена: одновременно в работе не больше 2 * jobs пачек, сравнения не сохраняются.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    changes = git_diff_blob_changes(branch1, branch2)
+    if not changes:
+        return
+    blob_ids = {c["path"]: c for c in changes}
+
+    def get_blob_id(branch, file_path):
+        change = blob_ids[file_path]
+        return change["blob2"] if branch == branch2 else change["blob1"]
+
+    # Индекс коммитов ветки спрашивается только о файлах, которые в ней есть:
+    # иначе обход истории не остановится раньше времени
+    commit_indexes = {
+        branch: CommitInfoIndex(branch, [c["path"] for c in changes if get_blob_id(branch, c["path"])]).start()
+        for branch in (branch1, branch2)
+    }
+
+    def get_commit_info(branch, file_path):
+        index = commit_indexes[branch]
+        return index.get(file_path) if file_path in index else empty_commit_info()
+
+    # Кэш сессии с нулевым пределом: каждая пачка вытесняется сразу после обработки
+    session = SessionCache(
+        branch1, branch2,
+        read_file_at_branch,
+        get_commit_info,
+        get_contents=lambda branch, files: read_files_at_branches([branch], files)[branch],
+        get_blob_id=get_blob_id,
+        get_blob_info=BlobInfoCache(blob_ids),
+        get_preview=read_preview_at_branch,
+        max_bytes=0,
+    )
+    chunks = iter([changes[i:i + chunk_size] for i in range(0, len(changes), chunk_size)])
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="report") as executor:
+        running = set()
+        for chunk in chunks:
+            running.add(executor.submit(_classify_chunk, session, chunk))
+            if len(running) >= 2 * jobs:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def write_report(records, out, report_format="ndjson"):
+    """
+    Пишет записи в поток по одной, не накапливая их: NDJSON или JSON-массив.
+    """
+    count = 0
+    if report_format == "json":
+        out.write("[")
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False)
+        if report_format == "json":
+            out.write(("\n" if count == 0 else ",\n") + line)
+        else:
+            out.write(line + "\n")
+        out.flush()
+        count += 1
+    if report_format == "json":
+        out.write("\n]\n")
+    out.flush()
+    return count
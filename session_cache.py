@@ -0,0 +1,368 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from diff_engine import DISPLAY_ENGINE, get_diff_engine
+from file_features import FileFeatures, classify_lines
+from format_cache import format_sql_cached_many
+from git_utils import is_binary
+from profiling import diff_size_class, span
+from sql_tokens import tokens_equal
+
+# Сколько соседних файлов в каждую сторону прогревать заранее
+DEFAULT_PREFETCH_DEPTH = 5
+
+# Предел памяти под сравнения файлов за сессию (приблизительно, в байтах)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Файлы больше этого размера (в любой из веток) не читаются целиком, не форматируются
+# и не сравниваются построчно: показывается начало файла размером PREVIEW_BYTES
+MAX_TEXT_BYTES = 5 * 1024 * 1024
+PREVIEW_BYTES = 256 * 1024
+
+# Приблизительные накладные расходы Python на строку в списке и на один опкод
+_LINE_OVERHEAD = 64
+_OPCODE_OVERHEAD = 120
+
+
+class FileComparison:
+    """
+    Все, что нужно для показа одного файла: исходные тексты, отформатированные строки,
+    опкоды диффа, признаки для фильтров и информация о последних коммитах.
+    Форматирование, опкоды, признаки и коммиты заполняются по мере необходимости;
+    для файлов, совпадающих по токенам, признаки известны без форматирования.
+    Двоичные и слишком большие файлы (kind = "binary" / "large") не форматируются и не сравниваются:
+    вердикт "совпадает / отличается" берется по blob ID, а content - начало файла для просмотра.
+    """
+    __slots__ = ("path", "content1", "content2", "lines1", "lines2", "opcodes", "features",
+                 "info1", "info2", "kind", "blob_size1", "blob_size2", "size", "cached_size")
+
+    def __init__(self, path, content1, content2, formatted1=None, formatted2=None):
+        self.path = path
+        self.content1 = content1
+        self.content2 = content2
+        self.lines1 = None
+        self.lines2 = None
+        self.opcodes = None
+        self.features = None
+        self.info1 = None
+        self.info2 = None
+        self.kind = None
+        self.blob_size1 = None
+        self.blob_size2 = None
+        self.size = 0
+        self.cached_size = 0  # размер, учтенный в SessionCache.total_bytes (меняется под блокировкой кэша)
+        if formatted1 is not None:
+            self.set_formatted(formatted1, formatted2)
+        else:
+            self.update_size()
+
+    # Запись разделяется между потоками предзагрузки и потоком Tk без блокировки: готовность
+    # проверяется по lines1 / info1, поэтому они присваиваются последними, когда пара уже собрана
+
+    def set_formatted(self, formatted1, formatted2):
+        lines1, lines2 = formatted1.splitlines(), formatted2.splitlines()
+        self.lines2 = lines2
+        self.lines1 = lines1
+        self.update_size()
+
+    def set_info(self, info1, info2):
+        self.info2 = info2
+        self.info1 = info1
+
+    def mark_skipped(self, kind, differs, blob_size1, blob_size2):
+        # Форматирование и дифф не выполняются: пустые опкоды означают "уже посчитано"
+        self.kind = kind
+        self.blob_size1 = blob_size1
+        self.blob_size2 = blob_size2
+        if kind == "binary":
+            self.content1 = self.content2 = ""
+        self.opcodes = []
+        self.features = FileFeatures(has_diff=differs)
+        self.update_size()
+
+    def update_size(self):
+        size = 2 * (len(self.content1) + len(self.content2))
+        for lines in (self.lines1, self.lines2):
+            if lines is not None:
+                size += sum(len(line) for line in lines) + _LINE_OVERHEAD * len(lines)
+        if self.opcodes is not None:
+            size += _OPCODE_OVERHEAD * len(self.opcodes)
+        self.size = size
+        return size
+
+    def compute_features(self):
+        if self.features is None and self.lines1 is not None:
+            line_count = len(self.lines1) + len(self.lines2)
+            with span(f"classify {diff_size_class(line_count)}", path=self.path, lines=line_count):
+                self.features = classify_lines(self.lines1, self.lines2)
+        return self.features
+
+    def compute_diff(self):
+        # Опкоды нужны только для показа; признаки считаются отдельно тем же способом, что и при классификации
+        self.compute_features()
+        if self.opcodes is None and self.lines1 is not None:
+            line_count = len(self.lines1) + len(self.lines2)
+            with span(f"diff {diff_size_class(line_count)}", path=self.path, lines=line_count):
+                self.opcodes = get_diff_engine(DISPLAY_ENGINE).analyze(self.lines1, self.lines2).opcodes
+        return self.opcodes
+
+
+class SessionCache:
+    """
+    Кэш сравнений файлов на время сессии с вытеснением LRU по приблизительному размеру.
+
+    :param get_content: get_content(branch, file) -> str
+    :param get_commit_info: get_commit_info(branch, file) -> dict; с info_timeout вызывается как
+        get_commit_info(branch, file, timeout=...) и возвращает None, если информация еще не готова
+    :param get_contents: Пакетное чтение get_contents(branch, files) -> {file: str}
+    :param get_blob_id: get_blob_id(branch, file) -> SHA blob'а или None
+    :param get_blob_info: Размеры до чтения get_blob_info(branch, files) -> {file: (sha, size) или None}
+    :param get_preview: Начало большого файла get_preview(branch, file, max_bytes) -> str
+    :param max_bytes: Предел суммарного размера записей
+    :param token_precheck: Не форматировать файлы, совпадающие по каноническим токенам SQL
+    :param max_text_bytes: Файлы больше этого размера показываются только началом
+    """
+    def __init__(self, branch1, branch2, get_content, get_commit_info,
+                 get_contents=None, get_blob_id=None, max_bytes=DEFAULT_MAX_BYTES, token_precheck=True,
+                 get_blob_info=None, get_preview=None, max_text_bytes=MAX_TEXT_BYTES):
+        self.branch1 = branch1
+        self.branch2 = branch2
+        self.get_content = get_content
+        self.get_commit_info = get_commit_info
+        self.get_contents = get_contents
+        self.get_blob_id = get_blob_id
+        self.max_bytes = max_bytes
+        self.token_precheck = token_precheck
+        self.get_blob_info = get_blob_info
+        self.get_preview = get_preview
+        self.max_text_bytes = max_text_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def read_contents(self, files):
+        # Содержимое файлов в обеих ветках одним пакетом, если это поддерживается
+        if self.get_contents is not None:
+            return self.get_contents(self.branch1, files), self.get_contents(self.branch2, files)
+        contents1 = {f: self.get_content(self.branch1, f) for f in files}
+        contents2 = {f: self.get_content(self.branch2, f) for f in files}
+        return contents1, contents2
+
+    def blob_id(self, branch, file_name):
+        if self.get_blob_id is None:
+            return None
+        return self.get_blob_id(branch, file_name)
+
+    def read_blob_info(self, files):
+        if self.get_blob_info is None:
+            return {}, {}
+        return self.get_blob_info(self.branch1, files), self.get_blob_info(self.branch2, files)
+
+    def read_preview(self, branch, file_name):
+        if self.get_preview is None:
+            return self.get_content(branch, file_name)[:PREVIEW_BYTES]
+        return self.get_preview(branch, file_name, PREVIEW_BYTES)
+
+    def _load(self, files):
+        # Размеры известны до чтения: большие файлы читаются только с начала
+        infos1, infos2 = self.read_blob_info(files)
+        sizes = {f: (_blob_size(infos1.get(f)), _blob_size(infos2.get(f))) for f in files}
+        large = [f for f in files if max(sizes[f]) > self.max_text_bytes]
+        large_set = set(large)
+        regular = [f for f in files if f not in large_set]
+        entries = {}
+        if regular:
+            contents1, contents2 = self.read_contents(regular)
+            for f in regular:
+                entry = entries[f] = FileComparison(f, contents1[f], contents2[f])
+                if self.get_blob_info is not None:
+                    entry.blob_size1, entry.blob_size2 = sizes[f]
+                if is_binary(entry.content1) or is_binary(entry.content2):
+                    if self.get_blob_info is not None:
+                        entry.mark_skipped("binary", infos1.get(f) != infos2.get(f), *sizes[f])
+                    else:
+                        entry.mark_skipped("binary", entry.content1 != entry.content2,
+                                           len(entry.content1), len(entry.content2))
+                # Совпадение по токенам означает одинаковый результат форматирования
+                elif self.token_precheck and tokens_equal(entry.content1, entry.content2):
+                    entry.features = FileFeatures()
+        for f in large:
+            entry = entries[f] = FileComparison(f, self.read_preview(self.branch1, f),
+                                                self.read_preview(self.branch2, f))
+            kind = "binary" if is_binary(entry.content1) or is_binary(entry.content2) else "large"
+            entry.mark_skipped(kind, infos1.get(f) != infos2.get(f), *sizes[f])
+        return {f: entries[f] for f in files}
+
+    def _format(self, entries):
+        if not entries:
+            return
+        # Форматируем обе стороны одним пакетом
+        formatted = format_sql_cached_many(
+            [e.content1 for e in entries] + [e.content2 for e in entries],
+            [self.blob_id(self.branch1, e.path) for e in entries] +
+            [self.blob_id(self.branch2, e.path) for e in entries])
+        count = len(entries)
+        for i, entry in enumerate(entries):
+            entry.set_formatted(formatted[i], formatted[count + i])
+
+    def get_many(self, files, with_diff=False, with_info=False, with_lines=False, info_timeout=None):
+        """
+        :param with_diff: Нужны признаки отличий (features)
+        :param with_info: Нужна информация о последних коммитах
+        :param info_timeout: Сколько ждать информацию о коммитах (секунды); не дождавшись,
+            запись остается без нее (info1 is None), и ее можно запросить позже
+        :param with_lines: Нужны отформатированные строки и опкоды (для показа)
+        :return: {file: FileComparison} для всех запрошенных файлов
+        """
+        result = {}
+        with self._lock:
+            for f in files:
+                entry = self._entries.get(f)
+                if entry is not None:
+                    self._entries.move_to_end(f)
+                    self.hits += 1
+                    result[f] = entry
+        missing = [f for f in files if f not in result]
+        # Чтение и форматирование идут без блокировки: их могут выполнять несколько потоков
+        if missing:
+            result.update(self._load(missing))
+        self._format([e for e in result.values() if e.lines1 is None and e.kind is None
+                      and (with_lines or (with_diff and e.features is None))])
+        for entry in result.values():
+            if with_lines:
+                entry.compute_diff()
+            elif with_diff:
+                entry.compute_features()
+            if with_info and entry.info1 is None:
+                self._load_info(entry, info_timeout)
+        # Записи могли вырасти (форматирование, дифф) без блокировки, в том числе в других потоках:
+        # учитывается разница с тем размером, который уже входит в total_bytes
+        with self._lock:
+            for f in missing:
+                if f not in self._entries:
+                    self.misses += 1
+                    self._entries[f] = result[f]
+            for entry in result.values():
+                if self._entries.get(entry.path) is entry:
+                    size = entry.update_size()
+                    self.total_bytes += size - entry.cached_size
+                    entry.cached_size = size
+            self._evict()
+        return result
+
+    def _load_info(self, entry, timeout):
+        if timeout is None:
+            entry.set_info(self.get_commit_info(self.branch1, entry.path),
+                           self.get_commit_info(self.branch2, entry.path))
+            return
+        info1 = self.get_commit_info(self.branch1, entry.path, timeout=timeout)
+        info2 = self.get_commit_info(self.branch2, entry.path, timeout=timeout) if info1 is not None else None
+        if info2 is not None:
+            entry.set_info(info1, info2)
+
+    def get(self, file_name, with_diff=True, with_info=True, with_lines=True, info_timeout=None):
+        return self.get_many([file_name], with_diff=with_diff, with_info=with_info,
+                             with_lines=with_lines, info_timeout=info_timeout)[file_name]
+
+    def peek(self, file_name):
+        with self._lock:
+            return self._entries.get(file_name)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.cached_size
+
+    def invalidate(self, file_name):
+        with self._lock:
+            entry = self._entries.pop(file_name, None)
+            if entry is not None:
+                self.total_bytes -= entry.cached_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.total_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def _blob_size(info):
+    # info: (sha, size) из get_blob_info; отсутствующий файл имеет размер 0
+    return info[1] if info is not None else 0
+
+
+class Prefetcher:
+    """
+    Фоновый прогрев кэша сессии для файлов рядом с текущим в списке.
+    При переходе к другому файлу еще не начатые задачи отменяются,
+    а новые ставятся в очередь от ближайших соседей к дальним.
+
+    :param session: SessionCache
+    :param depth: Число файлов до и после текущего
+    :param workers: Число рабочих потоков
+    """
+    def __init__(self, session, depth=DEFAULT_PREFETCH_DEPTH, workers=2):
+        self.session = session
+        self.depth = depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._pending = {}
+        # Колбэки отмененных задач вызываются сразу, под этой же блокировкой
+        self._lock = threading.RLock()
+
+    def neighbours(self, files, index):
+        # Ближайшие сначала: +1, -1, +2, -2, ...
+        result = []
+        for distance in range(1, self.depth + 1):
+            for i in (index + distance, index - distance):
+                if 0 <= i < len(files):
+                    result.append(files[i])
+        return result
+
+    def prefetch_around(self, files, index):
+        if self.depth <= 0:
+            return
+        self.prefetch(self.neighbours(files, index))
+
+    def prefetch(self, paths):
+        with self._lock:
+            wanted = set(paths)
+            for path, future in list(self._pending.items()):
+                if path not in wanted and future.cancel():
+                    # Колбэк отмены (_forget) уже мог убрать запись
+                    self._pending.pop(path, None)
+            for path in paths:
+                entry = self.session.peek(path)
+                if entry is not None and entry.opcodes is not None and entry.info1 is not None:
+                    continue
+                future = self._pending.get(path)
+                if future is not None and not future.done():
+                    # Уже стоит в очереди: переставляем, чтобы соблюсти порядок приоритета
+                    if not future.cancel():
+                        continue
+                future = self._pending[path] = self._executor.submit(self._load, path)
+                future.add_done_callback(lambda f, p=path: self._forget(p, f))
+
+    def _forget(self, path, future):
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+
+    def _load(self, path):
+        try:
+            self.session.get(path)
+        except Exception as e:
+            print(f"Ошибка предзагрузки {path}: {e}")
+
+    def close(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
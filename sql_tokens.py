@@ -0,0 +1,132 @@
+import argparse
+import re
+import sys
+
+from ch_format import clean_sql_query
+
+# Начальные ключевые слова инструкций; регистр не важен только в этой позиции (clickhouse-format
+# печатает их в верхнем регистре). В остальных местах почти любое ключевое слово ClickHouse может
+# быть именем колонки или функции (engine, table, in, is в system.tables и system.parts),
+# а регистр идентификатора значим, поэтому там слова сравниваются как есть.
+_OBJECTS = ("TABLE", "VIEW", "MATERIALIZED VIEW", "DATABASE", "DICTIONARY")
+STATEMENT_PREFIXES = tuple(sorted(
+    {tuple(prefix.split()) for prefix in (
+        "SELECT", "WITH", "INSERT INTO", "ALTER TABLE", "OPTIMIZE TABLE", "RENAME TABLE",
+        *(f"CREATE {obj}" for obj in _OBJECTS),
+        *(f"CREATE {obj} IF NOT EXISTS" for obj in _OBJECTS),
+        *(f"DROP {obj}" for obj in _OBJECTS),
+        *(f"DROP {obj} IF EXISTS" for obj in _OBJECTS),
+    )},
+    key=len, reverse=True))
+
+_TOKEN_RE = re.compile(r"""
+      (?P<ws>\s+)
+    | (?P<line_comment>--[^\n]*)
+    | (?P<block_comment>/\*.*?\*/)
+    | (?P<string>'(?:[^'\\]|\\.|'')*')
+    | (?P<quoted>"(?:[^"\\]|\\.|"")*"|`(?:[^`\\]|\\.|``)*`)
+    | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<op><=|>=|!=|<>|==|\|\||->|::)
+    | (?P<char>[^\s])
+""", re.VERBOSE | re.DOTALL)
+
+
+class TokenizeError(Exception):
+    pass
+
+
+def canonical_tokens(sql_query: str) -> tuple:
+    """
+    Канонический поток токенов SQL после тех же правил очистки, что и перед clickhouse-format:
+    пробелы и комментарии отброшены, начальные ключевые слова инструкций (STATEMENT_PREFIXES)
+    в верхнем регистре, остальные слова, строки и числа - как есть.
+
+    :raises TokenizeError: Незакрытая строка, идентификатор или комментарий
+    """
+    text = clean_sql_query(sql_query)
+    tokens = []
+    starts = []  # позиции первых токенов инструкций
+    pos = 0
+    length = len(text)
+    while pos < length:
+        match = _TOKEN_RE.match(text, pos)
+        kind = match.lastgroup
+        value = match.group()
+        pos = match.end()
+        if kind in ("ws", "line_comment", "block_comment"):
+            continue
+        if kind == "char" and value in "'\"`":
+            raise TokenizeError(f"unterminated literal at position {match.start()}")
+        if kind == "char" and value == "/" and text.startswith("/*", match.start()):
+            raise TokenizeError(f"unterminated comment at position {match.start()}")
+        if not tokens or tokens[-1] == ";":
+            starts.append(len(tokens))
+        tokens.append(value)
+    for start in starts:
+        for prefix in STATEMENT_PREFIXES:
+            if tuple(t.upper() for t in tokens[start:start + len(prefix)]) == prefix:
+                tokens[start:start + len(prefix)] = prefix
+                break
+    return tuple(tokens)
+
+
+def tokens_equal(sql_query1: str, sql_query2: str) -> bool:
+    """
+    True, если тексты гарантированно форматируются одинаково и clickhouse-format можно не вызывать.
+    При любой неуверенности (ошибка разбора, разные токены) возвращает False.
+    """
+    if sql_query1 == sql_query2:
+        return True
+    try:
+        return canonical_tokens(sql_query1) == canonical_tokens(sql_query2)
+    except TokenizeError:
+        return False
+
+
+def validate(pairs, format_many):
+    """
+    Проверяет предварительное сравнение на корпусе: для пар, признанных одинаковыми по токенам,
+    результаты clickhouse-format тоже должны совпадать.
+
+    :param pairs: Итератор (имя, текст1, текст2)
+    :param format_many: Функция форматирования списка текстов
+    :return: (число пар, число пар, одинаковых по токенам, список имен с расхождениями)
+    """
+    total = 0
+    token_equal = []
+    for name, text1, text2 in pairs:
+        total += 1
+        if tokens_equal(text1, text2):
+            token_equal.append((name, text1, text2))
+    mismatches = []
+    if token_equal:
+        formatted = format_many([t1 for _, t1, _ in token_equal] + [t2 for _, _, t2 in token_equal])
+        count = len(token_equal)
+        for i, (name, _, _) in enumerate(token_equal):
+            if formatted[i] != formatted[count + i]:
+                mismatches.append(name)
+    return total, len(token_equal), mismatches
+
+
+def main():
+    from ch_format import format_sql_many
+    from git_utils import git_diff_blob_changes, read_file_at_branch
+
+    parser = argparse.ArgumentParser(
+        description="Validate the token pre-check against clickhouse-format on files that differ between branches")
+    parser.add_argument("--branch1", required=True)
+    parser.add_argument("--branch2", required=True)
+    args = parser.parse_args()
+
+    pairs = ((c["path"], read_file_at_branch(args.branch1, c["path"]), read_file_at_branch(args.branch2, c["path"]))
+             for c in git_diff_blob_changes(args.branch1, args.branch2))
+    total, equal, mismatches = validate(pairs, format_sql_many)
+    print(f"Файлов: {total}, одинаковых по токенам: {equal}, расхождений с clickhouse-format: {len(mismatches)}")
+    for name in mismatches:
+        print(f"  {name}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
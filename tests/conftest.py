@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Модули лежат в корне репозитория, без пакета
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Заглушка clickhouse-format с разметкой вывода clickhouse-format -n: после каждого запроса
+# ';' отдельной строкой и пустая строка. Запросы только нормализуются по пробелам.
+STUB_FORMATTER = """\
+import sys
+
+if "--version" in sys.argv:
+    print("clickhouse-format stub (tests)")
+    sys.exit(0)
+for query in sys.stdin.read().split(";"):
+    query = " ".join(query.split())
+    if query:
+        sys.stdout.write(query.replace(" FROM ", "\\nFROM ") + "\\n;\\n\\n")
+"""
+
+
+@pytest.fixture
+def stub_formatter(tmp_path, monkeypatch):
+    """
+    Кладет заглушку clickhouse-format в начало PATH на время теста.
+    """
+    directory = tmp_path / "stub_bin"
+    directory.mkdir()
+    script = directory / "clickhouse_format_stub.py"
+    script.write_text(STUB_FORMATTER, encoding="utf-8")
+    # На macOS вызывается "clickhouse format", на остальных системах "clickhouse-format"
+    for name in ("clickhouse-format", "clickhouse"):
+        launcher = directory / name
+        launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n', encoding="utf-8")
+        launcher.chmod(0o755)
+    monkeypatch.setenv("PATH", str(directory) + os.pathsep + os.environ.get("PATH", ""))
+    return directory
+
+
+def git(repo, *args, author="Author"):
+    subprocess.run(["git", "-c", f"user.name={author}", "-c", "user.email=a@localhost",
+                    "-c", "commit.gpgsign=false", *args], cwd=repo, check=True, capture_output=True)
+
+
+def git_output(repo, *args):
+    return subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def write(repo, path, text):
+    full_path = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = str(tmp_path / "repo")
+    os.makedirs(path)
+    git(path, "init", "-q", "-b", "main")
+    return path
@@ -0,0 +1,60 @@
+import pytest
+
+import ch_format
+from ch_format import format_sql_batch, format_sql_with_clickhouse_format, split_statements
+from profiling import PROFILER
+
+DOCUMENTS = [
+    "select a,b from t",
+    "CREATE TABLE t (x UInt8, y String) ENGINE = Log",
+    "SELECT 1; SELECT 2",
+    "SELECT 1 -- комментарий в конце документа",
+    "SELECT 'a;b' FROM t;",
+]
+
+
+def test_batch_matches_single_documents(stub_formatter):
+    expected = [format_sql_with_clickhouse_format(d) for d in DOCUMENTS]
+    PROFILER.enable()
+    try:
+        assert format_sql_batch(DOCUMENTS) == expected
+        # Все документы - один запуск форматтера
+        assert PROFILER.counter("format.spawn") == 1
+    finally:
+        PROFILER.enabled = False
+        PROFILER.reset()
+
+
+def test_batch_keeps_positions_of_empty_documents(stub_formatter):
+    documents = ["", "SELECT 1", "  ", "SELECT 2"]
+    assert format_sql_batch(documents) == [format_sql_with_clickhouse_format(d) for d in documents]
+
+
+def test_failed_batch_is_bisected_to_the_broken_document(stub_formatter, monkeypatch):
+    run = ch_format.run_clickhouse_format
+
+    def failing_run(text):
+        if "BROKEN" in text:
+            raise Exception("clickhouse-format error: Syntax error")
+        return run(text)
+
+    monkeypatch.setattr(ch_format, "run_clickhouse_format", failing_run)
+    documents = DOCUMENTS[:2] + ["SELECT BROKEN"] + DOCUMENTS[2:]
+    result = format_sql_batch(documents)
+    assert result[2].startswith("Error: ")
+    assert result[:2] + result[3:] == [format_sql_with_clickhouse_format(d) for d in DOCUMENTS]
+
+
+@pytest.mark.parametrize("lines,expected", [
+    (["SELECT 1;", "", "", "SELECT 2;"], [(0, 1), (1, 3), (3, 4)]),
+    (["SELECT 1"], [(0, 1)]),
+    (["SELECT 'a;", "b';"], [(0, 2)]),
+    (["SELECT `a;`", "FROM t;"], [(0, 2)]),
+    (["SELECT 1 -- x;", "FROM t;"], [(0, 2)]),
+    (["/* a;", "b; */ SELECT 1;"], [(0, 2)]),
+    (["SELECT 1; -- конец", "SELECT 2;"], [(0, 1), (1, 2)]),
+    ([], []),
+], ids=["blank run", "no semicolon", "string", "quoted identifier", "line comment", "block comment",
+        "comment after semicolon", "empty"])
+def test_split_statements(lines, expected):
+    assert split_statements(lines) == expected
@@ -0,0 +1,54 @@
+import json
+
+from decision_journal import DecisionJournal
+
+
+def journal(tmp_path, branch2="b2"):
+    return DecisionJournal("b1", branch2, "b3", path=str(tmp_path / "journal.jsonl"))
+
+
+def test_resume_after_restart(tmp_path):
+    first = journal(tmp_path)
+    assert first.load() == 0
+    first.record("a.sql", "b1")
+    first.record("b.sql", "b2", "SELECT 1;")
+    second = journal(tmp_path)
+    assert second.load() == 2
+    assert second.decisions["b.sql"]["content"] == "SELECT 1;"
+
+
+def test_stale_header_is_rotated(tmp_path):
+    old = journal(tmp_path, branch2="other")
+    old.record("a.sql", "b1")
+    new = journal(tmp_path)
+    assert new.load() == 0
+    new.record("b.sql", "b2", "x")
+    assert journal(tmp_path).load() == 1
+    assert (tmp_path / "journal.jsonl.stale").exists()
+
+
+def test_record_without_load_does_not_append_to_foreign_journal(tmp_path):
+    journal(tmp_path, branch2="other").record("a.sql", "b1")
+    journal(tmp_path).record("b.sql", "b1")
+    resumed = journal(tmp_path)
+    assert resumed.load() == 1
+    assert list(resumed.decisions) == ["b.sql"]
+
+
+def test_truncated_header_does_not_raise(tmp_path):
+    (tmp_path / "journal.jsonl").write_text('{"branch1": "b', encoding="utf-8")
+    assert journal(tmp_path).load() == 0
+
+
+def test_truncated_tail_is_dropped_and_later_records_survive(tmp_path):
+    first = journal(tmp_path)
+    first.record("a.sql", "b1")
+    with open(first.path, "a", encoding="utf-8") as f:
+        f.write('{"path": "b.sql", "bra')
+    second = journal(tmp_path)
+    assert second.load() == 1
+    second.record("c.sql", "b1")
+    third = journal(tmp_path)
+    assert third.load() == 2
+    with open(third.path, encoding="utf-8") as f:
+        assert all(json.loads(line) for line in f)
@@ -0,0 +1,71 @@
+import difflib
+import random
+
+import pytest
+
+from diff_engine import ENGINES, FALLBACK_MAX_CELLS, patience_matches
+
+
+def assert_valid_opcodes(lines1, lines2, opcodes):
+    # Опкоды покрывают обе стороны подряд, 'equal' - действительно равные участки
+    i = j = 0
+    rebuilt = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        if tag == 'equal':
+            assert lines1[i1:i2] == lines2[j1:j2]
+        rebuilt += lines2[j1:j2]
+        i, j = i2, j2
+    assert (i, j) == (len(lines1), len(lines2))
+    assert rebuilt == lines2
+
+
+@pytest.mark.parametrize("engine", ["patience", "statement"])
+def test_opcodes_reconstruct_on_random_input(engine):
+    rng = random.Random(1)
+    for _ in range(500):
+        alphabet = rng.choice([2, 3, 30])
+        lines1 = [f"SELECT {rng.randrange(alphabet)};" for _ in range(rng.randint(0, 40))]
+        lines2 = [line for line in lines1 if rng.random() < 0.8]
+        lines2 += [f"SELECT {rng.randrange(alphabet)};" for _ in range(rng.randint(0, 5))]
+        assert_valid_opcodes(lines1, lines2, ENGINES[engine].opcodes(lines1, lines2))
+
+
+def test_matches_are_increasing():
+    rng = random.Random(2)
+    for _ in range(300):
+        a = [rng.randrange(3) for _ in range(rng.randint(0, 50))]
+        b = [rng.randrange(3) for _ in range(rng.randint(0, 50))]
+        matches = patience_matches(a, b)
+        assert all(m1[0] < m2[0] and m1[1] < m2[1] for m1, m2 in zip(matches, matches[1:]))
+        assert all(a[i] == b[j] for i, j in matches)
+
+
+@pytest.mark.parametrize("engine", ["patience", "statement"])
+def test_repeated_blocks_bound_the_fallback(engine, monkeypatch):
+    # Нет ни одной уникальной строки: раньше весь файл уходил в SequenceMatcher (почти кубическое время).
+    # Проверяется объем работы запасного алгоритма, а не время, чтобы тест не зависел от машины
+    regions = []
+
+    class RecordingMatcher(difflib.SequenceMatcher):
+        def __init__(self, isjunk=None, a="", b="", autojunk=True):
+            regions.append(len(a) * len(b))
+            super().__init__(isjunk, a, b, autojunk)
+
+    monkeypatch.setattr(difflib, "SequenceMatcher", RecordingMatcher)
+    block = ["INSERT INTO db.events", "SELECT *", "FROM db.events_buffer", "WHERE date = today();"]
+    lines1 = block * 800
+    lines2 = [line.lower() if (n // 4) % 2 else line for n, line in enumerate(lines1)]
+    opcodes = ENGINES[engine].opcodes(lines1, lines2)
+    assert all(cells <= FALLBACK_MAX_CELLS for cells in regions)
+    assert sum(regions) <= 4 * FALLBACK_MAX_CELLS
+    assert_valid_opcodes(lines1, lines2, opcodes)
+
+
+def test_moved_statement_is_not_a_change():
+    lines1 = ["CREATE TABLE a (x UInt8);", "CREATE TABLE b (y UInt8);", "CREATE TABLE c (z UInt8);"]
+    lines2 = ["CREATE TABLE b (y UInt8);", "CREATE TABLE c (z UInt8);", "CREATE TABLE a (x UInt8);"]
+    result = ENGINES["statement"].analyze(lines1, lines2)
+    assert result.moved == 1
+    assert result.changed_lines == []
+    assert_valid_opcodes(lines1, lines2, result.opcodes)
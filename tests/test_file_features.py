@@ -0,0 +1,23 @@
+from file_features import classify_lines
+
+
+def test_equal_files_have_no_diff():
+    lines = ["SELECT 1", ";"]
+    features = classify_lines(lines, list(lines))
+    assert not features.has_diff and not features.has_drop
+
+
+def test_drop_anywhere_in_changed_statement():
+    # DROP стоит в неизмененной строке, но инструкция изменена целиком
+    features = classify_lines(["DROP TABLE t", "SETTINGS a = 1;"], ["DROP TABLE t", "SETTINGS a = 2;"])
+    assert features.has_diff and features.has_drop
+
+
+def test_drop_in_identifier_is_not_a_drop():
+    features = classify_lines(["SELECT dropped_at", "FROM t;"], ["SELECT dropped_at, b", "FROM t;"])
+    assert features.has_diff and not features.has_drop
+
+
+def test_drop_in_unchanged_statement_is_ignored():
+    features = classify_lines(["DROP TABLE t;", "", "SELECT 1;"], ["DROP TABLE t;", "", "SELECT 2;"])
+    assert features.has_diff and not features.has_drop
@@ -0,0 +1,57 @@
+import itertools
+from types import SimpleNamespace
+
+import format_cache
+from format_cache import FormatCache, git_blob_sha
+
+
+def fake_formatter(monkeypatch):
+    calls = []
+
+    def format_many(queries):
+        calls.append(list(queries))
+        return ["Error: bad" if q == "bad" else q.upper() for q in queries]
+
+    monkeypatch.setattr(format_cache, "format_sql_many", format_many)
+    return calls
+
+
+def test_hits_and_misses_are_counted_per_document(monkeypatch):
+    calls = fake_formatter(monkeypatch)
+    cache = FormatCache(":memory:", version="v")
+    assert cache.format_many(["a", "b", "a"]) == ["A", "B", "A"]
+    # Одинаковые тексты форматируются один раз
+    assert calls == [["a", "b"]]
+    assert (cache.hits, cache.misses) == (0, 3)
+    assert cache.format_many(["a", "b"]) == ["A", "B"]
+    assert len(calls) == 1
+    assert cache.stats() == {"hits": 2, "misses": 3, "hit_rate": 0.4}
+
+
+def test_errors_are_not_cached(monkeypatch):
+    calls = fake_formatter(monkeypatch)
+    cache = FormatCache(":memory:", version="v")
+    assert cache.format_many(["bad"]) == ["Error: bad"]
+    assert cache.format_many(["bad"]) == ["Error: bad"]
+    assert len(calls) == 2
+
+
+def test_eviction_drops_least_recently_used(monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(format_cache, "time", SimpleNamespace(time=lambda: next(clock)))
+    cache = FormatCache(":memory:", max_bytes=10, version="v")
+    cache.put_many({"a": "aaaa"})
+    cache.put_many({"b": "bbbb"})
+    cache.get_many(["a"])
+    cache.put_many({"c": "cccc"})
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+
+
+def test_formatter_version_is_part_of_the_key(tmp_path, monkeypatch):
+    fake_formatter(monkeypatch)
+    path = str(tmp_path / "cache.sqlite")
+    old = FormatCache(path, version="v1")
+    old.format_many(["a"])
+    old.close()
+    assert FormatCache(path, version="v1").get_many([git_blob_sha("a")]) == {git_blob_sha("a"): "A"}
+    assert FormatCache(path, version="v2").get_many([git_blob_sha("a")]) == {}
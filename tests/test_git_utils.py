@@ -0,0 +1,138 @@
+import subprocess
+
+import pytest
+
+import git_utils
+from conftest import git, git_output, write
+from git_utils import (BlobInfoCache, CommitInfoIndex, GitBlobReader, IndexWorkspace, git_blob_info,
+                       git_diff_blob_changes)
+from profiling import PROFILER
+from session_cache import SessionCache
+
+
+def test_commit_info_index_sees_merge_resolutions(repo):
+    write(repo, "f.sql", "a\n")
+    write(repo, "g.sql", "x\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init")
+    git(repo, "checkout", "-qb", "side")
+    write(repo, "f.sql", "b\n")
+    git(repo, "commit", "-qam", "side")
+    git(repo, "checkout", "-q", "main")
+    write(repo, "f.sql", "c\n")
+    git(repo, "commit", "-qam", "main")
+    with pytest.raises(subprocess.CalledProcessError):
+        git(repo, "merge", "-q", "side")
+    write(repo, "f.sql", "resolved\n")
+    git(repo, "add", "f.sql")
+    git(repo, "commit", "-qm", "merge", author="Merger")
+
+    index = CommitInfoIndex("main", ["f.sql", "g.sql"], cwd=repo).start()
+    assert index.get("f.sql", timeout=10)["author"] == "Merger"
+    assert index.get("g.sql", timeout=10)["author"] == "Author"
+
+
+def test_blob_reader_survives_missing_paths_with_spaces(repo):
+    write(repo, "d/with space.sql", "SELECT 1;\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init")
+    reader = GitBlobReader(cwd=repo)
+    try:
+        assert reader.read_file("main", "d/with space.sql") == "SELECT 1;"
+        process = reader._process
+        assert reader.read_blob("main", "d/no such.sql") is None
+        assert reader.read_blob("main", "d/a b c.sql") is None
+        assert reader.read_file("main", "d/with space.sql") == "SELECT 1;"
+        # Тот же процесс: ответ "missing" не сбил протокол
+        assert reader._process is process
+    finally:
+        reader.close()
+    assert git_blob_info("main", ["d/with space.sql", "d/no such.sql"], cwd=repo) == {
+        "d/with space.sql": (git_output(repo, "rev-parse", "main:d/with space.sql"), 10),
+        "d/no such.sql": None,
+    }
+
+
+def test_index_workspace_replaces_stale_worktree(repo):
+    write(repo, "a.sql", "SELECT 1;\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init")
+    # Прерванный запуск: рабочее дерево создано, но не удалено
+    stale = IndexWorkspace("main", "b3", cwd=repo)
+    stale.create()
+    workspace = IndexWorkspace("main", "b3", cwd=repo)
+    try:
+        workspace.create()
+        worktrees = git_output(repo, "worktree", "list", "--porcelain")
+        assert stale.path not in worktrees
+        assert workspace.path in worktrees
+    finally:
+        workspace.remove()
+    assert "refs/heads/b3" not in git_output(repo, "worktree", "list", "--porcelain")
+
+
+def test_session_reads_sizes_once_per_branch(repo, monkeypatch):
+    for name in ("a.sql", "b.sql", "c.sql"):
+        write(repo, name, "SELECT 1;\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init")
+    git(repo, "checkout", "-qb", "feature")
+    for name in ("a.sql", "b.sql", "c.sql"):
+        write(repo, name, "SELECT 1;\n\n")
+    git(repo, "commit", "-qam", "feature")
+    monkeypatch.chdir(repo)
+    files = ["a.sql", "b.sql", "c.sql"]
+    session = SessionCache("main", "feature", git_utils.read_file_at_branch,
+                           lambda branch, f: git_utils.empty_commit_info(),
+                           get_contents=lambda branch, fs: git_utils.read_files_at_branches([branch], fs)[branch],
+                           get_blob_info=BlobInfoCache(files))
+    PROFILER.enable()
+    try:
+        for name in files:
+            session.get_many([name])
+        # Один процесс cat-file --batch и по одному --batch-check на ветку
+        assert PROFILER.counter("git.spawn") == 3
+        assert session.peek("a.sql").blob_size2 == len("SELECT 1;\n\n")
+    finally:
+        PROFILER.enabled = False
+        PROFILER.reset()
+        git_utils.close_blob_readers()
+
+
+def test_diff_blob_changes_parses_raw_z_output(repo, monkeypatch):
+    body = "".join(f"SELECT {n};\n" for n in range(50))
+    write(repo, "old name.sql", body)
+    write(repo, "gone.sql", "SELECT 1;\n")
+    write(repo, "edit.sql", "SELECT 1;\n")
+    write(repo, "same.sql", "SELECT 1;\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init")
+    git(repo, "checkout", "-qb", "feature")
+    git(repo, "mv", "old name.sql", "new name.sql")
+    git(repo, "rm", "-q", "gone.sql")
+    write(repo, "edit.sql", "SELECT 2;\n")
+    write(repo, "line\nbreak.sql", "SELECT 3;\n")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "feature")
+    git(repo, "config", "diff.renames", "true")
+    monkeypatch.chdir(repo)
+    changes = {c["path"]: c for c in git_diff_blob_changes("main", "feature")}
+    # Переименование - удаление старого пути и добавление нового, в том числе при diff.renames
+    assert set(changes) == {"old name.sql", "new name.sql", "gone.sql", "edit.sql", "line\nbreak.sql"}
+    assert changes["new name.sql"]["blob1"] is None
+    assert changes["old name.sql"]["blob2"] is None
+    assert changes["gone.sql"]["blob2"] is None and changes["gone.sql"]["blob1"]
+    assert changes["line\nbreak.sql"]["blob1"] is None
+    assert [changes[p]["status"] for p in ("new name.sql", "gone.sql", "edit.sql", "line\nbreak.sql")] == [
+        "added", "deleted", "modified", "added"]
+    assert changes["edit.sql"]["mode1"] == changes["edit.sql"]["mode2"] == "100644"
+
+
+def test_commit_info_index_get_times_out_with_none(repo, monkeypatch):
+    write(repo, "f.sql", "a\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init")
+    index = CommitInfoIndex("main", ["f.sql"], cwd=repo)
+    # Обход не запускается: ответа нет, пока история не дошла до файла
+    monkeypatch.setattr(index, "start", lambda: index)
+    assert index.get("f.sql", timeout=0) is None
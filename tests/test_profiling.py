@@ -0,0 +1,57 @@
+import json
+
+from profiling import Profiler, Timing, diff_size_class
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    with profiler.span("git log"):
+        pass
+    profiler.count("git.spawn")
+    assert profiler.timings == {} and profiler.counters == {}
+
+
+def test_counters_timings_and_hit_rate():
+    profiler = Profiler()
+    profiler.enable()
+    profiler.count("git.spawn")
+    profiler.count("git.bytes_read", 100)
+    profiler.count("git.bytes_read", 50)
+    profiler.count("format_cache.hit", 3)
+    profiler.count("format_cache.miss")
+    with profiler.span("git log"):
+        pass
+    profiler.record("git cat-file", 0.002)
+    assert profiler.counter("git.bytes_read") == 150
+    assert profiler.hit_rate("format_cache") == 0.75
+    assert profiler.timings["git log"].count == 1
+    assert abs(profiler.total_ms("git ") - profiler.timings["git log"].total - 2) < 1e-9
+    summary = profiler.summary()
+    assert "git.bytes_read" in summary and "format_cache.hit_rate" in summary and "git cat-file" in summary
+    profiler.reset()
+    assert profiler.summary().endswith("нет данных")
+
+
+def test_timing_percentiles_use_bucket_bounds():
+    timing = Timing()
+    for ms in [0.3] * 90 + [30] * 10:
+        timing.add(ms / 1000)
+    assert timing.count == 100 and abs(timing.max - 30) < 1e-9
+    assert timing.percentile(0.5) == 0.5
+    assert timing.percentile(0.95) == 30
+
+
+def test_trace_events(tmp_path):
+    profiler = Profiler()
+    profiler.enable(trace=True)
+    with profiler.span("diff <1000", path="a.sql"):
+        pass
+    path = tmp_path / "trace.json"
+    assert profiler.write_trace(str(path)) == 1
+    event = json.loads(path.read_text(encoding="utf-8"))["traceEvents"][0]
+    assert (event["name"], event["ph"], event["args"]) == ("diff <1000", "X", {"path": "a.sql"})
+
+
+def test_diff_size_class():
+    assert [diff_size_class(n) for n in (0, 999, 1000, 99999, 100000)] == [
+        "<1000", "<1000", "<10000", "<100000", ">=100000"]
@@ -0,0 +1,62 @@
+import io
+import json
+
+import pytest
+
+from conftest import git, write
+from format_cache import close_format_cache
+from git_utils import close_blob_readers
+from report import iter_report, write_report
+
+
+@pytest.fixture
+def branches(repo, monkeypatch, stub_formatter):
+    write(repo, "same.sql", "SELECT 1;\n")
+    write(repo, "spaces.sql", "SELECT a FROM t;\n")
+    write(repo, "edit.sql", "SELECT a FROM t;\n")
+    write(repo, "drop.sql", "SELECT 1;\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init", author="Base")
+    git(repo, "checkout", "-qb", "feature")
+    write(repo, "spaces.sql", "SELECT  a\nFROM t;\n")
+    write(repo, "edit.sql", "SELECT b FROM t;\n")
+    write(repo, "drop.sql", "SELECT 1;\nDROP TABLE t;\n")
+    write(repo, "new.sql", "SELECT 2;\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "feature", author="Feature")
+    monkeypatch.chdir(repo)
+    # Кэш форматирования и читатели blob'ов общие на процесс: привязываем их к этому репозиторию
+    close_format_cache()
+    yield "main", "feature"
+    close_format_cache()
+    close_blob_readers()
+
+
+def test_report_classifies_every_changed_file(branches):
+    records = {r["path"]: r for r in iter_report(*branches, jobs=2, chunk_size=2)}
+    assert set(records) == {"spaces.sql", "edit.sql", "drop.sql", "new.sql"}
+    assert not records["spaces.sql"]["differs"]
+    assert records["edit.sql"]["differs"] and not records["edit.sql"]["has_drop"]
+    assert records["drop.sql"]["has_drop"]
+    assert records["new.sql"]["status"] == "added"
+    assert records["new.sql"]["branch1_commit"]["author"] is None
+    assert records["new.sql"]["branch2_commit"]["author"] == "Feature"
+    assert records["edit.sql"]["branch1_commit"]["author"] == "Base"
+    assert not any(r["format_error"] for r in records.values())
+
+
+@pytest.mark.parametrize("report_format", ["ndjson", "json"])
+def test_write_report_streams_records(report_format):
+    records = [{"path": "a.sql"}, {"path": "б.sql"}]
+    out = io.StringIO()
+    assert write_report(iter(records), out, report_format) == 2
+    if report_format == "json":
+        assert json.loads(out.getvalue()) == records
+    else:
+        assert [json.loads(line) for line in out.getvalue().splitlines()] == records
+
+
+def test_write_report_empty_json_is_valid():
+    out = io.StringIO()
+    assert write_report(iter([]), out, "json") == 0
+    assert json.loads(out.getvalue()) == []
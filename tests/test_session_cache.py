@@ -0,0 +1,160 @@
+import threading
+from types import SimpleNamespace
+
+import session_cache
+from session_cache import Prefetcher, SessionCache
+
+CONTENTS = {
+    "main": {"same.sql": "SELECT a FROM t", "diff.sql": "SELECT a FROM t"},
+    "feature": {"same.sql": "select a  FROM t", "diff.sql": "SELECT b FROM t"},
+}
+
+
+def make_session(monkeypatch, max_bytes=session_cache.DEFAULT_MAX_BYTES):
+    # Форматирование подменено: тесты не запускают clickhouse-format и не пишут кэш в .git
+    monkeypatch.setattr(session_cache, "format_sql_cached_many",
+                        lambda queries, blob_shas=None: [" ".join(q.split()) + "\n;" for q in queries])
+    return SessionCache("main", "feature",
+                        lambda branch, f: CONTENTS[branch][f],
+                        lambda branch, f: {"commit_hash": None, "author": None, "date": None},
+                        max_bytes=max_bytes)
+
+
+def test_total_bytes_follows_entries_through_classify_view_invalidate(monkeypatch):
+    session = make_session(monkeypatch)
+    # Классификация: same.sql совпадает по токенам и не форматируется
+    session.get_many(["same.sql", "diff.sql"], with_diff=True)
+    assert session.peek("same.sql").lines1 is None
+    # Просмотр: форматирование и дифф добавляются к уже учтенным записям
+    session.get("same.sql")
+    session.get("diff.sql")
+    assert session.total_bytes == sum(session.peek(f).update_size() for f in ("same.sql", "diff.sql"))
+    session.invalidate("same.sql")
+    session.invalidate("diff.sql")
+    assert session.total_bytes == 0
+
+
+def test_byte_limit_evicts_least_recently_used(monkeypatch):
+    session = make_session(monkeypatch)
+    session.get("same.sql")
+    session.max_bytes = session.total_bytes
+    session.get("diff.sql")
+    assert session.peek("same.sql") is None
+    assert session.peek("diff.sql") is not None
+    assert session.total_bytes == session.peek("diff.sql").size
+
+
+def test_commit_info_is_published_in_pairs(monkeypatch):
+    # Предзагрузка ждет коммит branch2; поток Tk в это время не должен увидеть половину пары
+    waiting, release = threading.Event(), threading.Event()
+    prefetch_thread = []
+
+    def get_commit_info(branch, f):
+        if branch == "feature" and threading.current_thread() in prefetch_thread:
+            waiting.set()
+            release.wait(10)
+        return {"commit_hash": branch, "author": branch, "date": None}
+
+    session = make_session(monkeypatch)
+    session.get_commit_info = get_commit_info
+    # Запись уже в кэше после классификации, но без информации о коммитах
+    session.get_many(["diff.sql"], with_diff=True)
+    prefetch = threading.Thread(target=session.get, args=("diff.sql",))
+    prefetch_thread.append(prefetch)
+    prefetch.start()
+    try:
+        assert waiting.wait(10)
+        comparison = session.get("diff.sql")
+        assert comparison.info1["author"] == "main"
+        assert comparison.info2["author"] == "feature"
+    finally:
+        release.set()
+        prefetch.join(10)
+
+
+def test_commit_info_timeout_leaves_entry_for_later(monkeypatch):
+    ready = threading.Event()
+
+    def get_commit_info(branch, f, timeout=None):
+        if not ready.wait(timeout):
+            return None
+        return {"commit_hash": branch, "author": branch, "date": None}
+
+    session = make_session(monkeypatch)
+    session.get_commit_info = get_commit_info
+    comparison = session.get("diff.sql", info_timeout=0)
+    assert comparison.info1 is None and comparison.info2 is None
+    assert comparison.lines1 is not None
+    ready.set()
+    comparison = session.get_many(["diff.sql"], with_info=True, info_timeout=0)["diff.sql"]
+    assert (comparison.info1["author"], comparison.info2["author"]) == ("main", "feature")
+
+
+class RecordingSession:
+    # Подмена SessionCache для Prefetcher: первая загрузка ждет сигнала, чтобы очередь успела собраться
+    def __init__(self, cached=()):
+        self.loaded = []
+        self.cached = set(cached)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def peek(self, path):
+        if path in self.cached:
+            return SimpleNamespace(opcodes=[], info1={})
+        return None
+
+    def get(self, path):
+        if not self.started.is_set():
+            self.started.set()
+            self.release.wait(10)
+        self.loaded.append(path)
+
+
+def run_prefetch(session, *requests):
+    prefetcher = Prefetcher(session, workers=1)
+    prefetcher.prefetch(requests[0])
+    assert session.started.wait(10)
+    for paths in requests[1:]:
+        prefetcher.prefetch(paths)
+    session.release.set()
+    prefetcher._executor.shutdown(wait=True)
+    return session.loaded
+
+
+def test_prefetch_neighbours_nearest_first():
+    prefetcher = Prefetcher(RecordingSession(), depth=2)
+    assert prefetcher.neighbours(list("abcdef"), 2) == ["d", "b", "e", "a"]
+    assert prefetcher.neighbours(list("abc"), 0) == ["b", "c"]
+    prefetcher.close()
+
+
+def test_prefetch_cancels_files_no_longer_wanted():
+    assert run_prefetch(RecordingSession(), ["a", "b", "c"], ["c", "d"]) == ["a", "c", "d"]
+
+
+def test_prefetch_reprioritises_queued_files():
+    assert run_prefetch(RecordingSession(), ["a", "b", "c"], ["a", "c", "b"]) == ["a", "c", "b"]
+
+
+def test_prefetch_skips_ready_entries():
+    assert run_prefetch(RecordingSession(cached={"b"}), ["a", "b", "c"]) == ["a", "c"]
+
+
+def test_large_and_binary_files_are_not_formatted(monkeypatch):
+    formatted = []
+    monkeypatch.setattr(session_cache, "format_sql_cached_many",
+                        lambda queries, blob_shas=None: formatted.extend(queries) or list(queries))
+    contents = {"big.sql": "SELECT 1;\n" * 10, "bin.dat": "x\0y"}
+    sizes = {"big.sql": 100, "bin.dat": 3}
+    session = SessionCache("main", "feature",
+                           lambda branch, f: contents[f] + branch,
+                           lambda branch, f: {"commit_hash": None, "author": None, "date": None},
+                           get_blob_info=lambda branch, files: {f: (branch + f, sizes[f]) for f in files},
+                           get_preview=lambda branch, f, max_bytes: contents[f][:20],
+                           max_text_bytes=50)
+    big, binary = session.get("big.sql"), session.get("bin.dat")
+    assert (big.kind, big.content1, big.blob_size1) == ("large", contents["big.sql"][:20], 100)
+    assert binary.kind == "binary" and binary.content1 == ""
+    # Вердикт по blob ID, без форматирования и диффа
+    assert big.features.has_diff and binary.features.has_diff
+    assert big.compute_diff() == [] and formatted == []
@@ -0,0 +1,74 @@
+import shutil
+
+import pytest
+
+from ch_format import clickhouse_format_command, format_sql_many
+from sql_tokens import TokenizeError, canonical_tokens, tokens_equal, validate
+
+# (имя, текст1, текст2, одинаковы ли по токенам)
+CORPUS = [
+    ("whitespace", "SELECT a,b FROM t", "SELECT  a ,\n  b\nFROM t", True),
+    ("comments", "SELECT a FROM t /* old */", "SELECT a /* new */ FROM t -- tail", True),
+    # clean_sql_query склеивает строки, и однострочный комментарий поглощает остаток текста
+    ("line comment swallows tail", "SELECT a FROM t", "SELECT a -- new\nFROM t", False),
+    ("statement keyword case", "select a FROM t; drop table if exists t", "SELECT a FROM t; DROP TABLE IF EXISTS t",
+     True),
+    ("create keywords", "create table if not exists db.t (x UInt8) ENGINE = Log",
+     "CREATE TABLE IF NOT EXISTS db.t (x UInt8) ENGINE = Log", True),
+    # Слова вне начала инструкции могут быть колонками: их регистр не приводится
+    ("clause keyword case", "select a from t where x = 1 and not y", "SELECT a FROM t WHERE x = 1 AND NOT y", False),
+    ("engine column", "SELECT engine FROM system.tables", "SELECT Engine FROM system.tables", False),
+    ("table column", "SELECT * FROM t WHERE table = 1", "SELECT * FROM t WHERE Table = 1", False),
+    ("in/is columns", "SELECT in, is FROM t", "SELECT IN, IS FROM t", False),
+    ("table named like keyword", "CREATE TABLE if (x UInt8) ENGINE = Log", "CREATE TABLE IF (x UInt8) ENGINE = Log",
+     False),
+    ("identifier case", "SELECT a FROM t", "SELECT A FROM t", False),
+    ("string case", "SELECT 'a'", "SELECT 'A'", False),
+    ("quoted identifier", "SELECT `a` FROM t", "SELECT `A` FROM t", False),
+    ("number", "SELECT 1", "SELECT 1.0", False),
+    ("hex literal and alias", "SELECT 0x1F", "SELECT 0 x1F", False),
+    ("column named like keywords", "CREATE TABLE t (first String, end UInt8) ENGINE = Log",
+     "CREATE TABLE t (FIRST String, END UInt8) ENGINE = Log", False),
+    ("column named order", "CREATE TABLE t (x UInt8, order UInt8) ENGINE = Log",
+     "CREATE TABLE t (x UInt8, ORDER UInt8) ENGINE = Log", False),
+    ("function named like keyword", "SELECT not(a), if(b, 1, 2)", "SELECT NOT(a), IF(b, 1, 2)", False),
+    ("qualified name", "SELECT db.select FROM t", "SELECT db.SELECT FROM t", False),
+    ("left/right functions", "SELECT left(s, 2), right(s, 2)", "SELECT LEFT(s, 2), RIGHT(s, 2)", False),
+    ("cast/format/array", "SELECT cast(x AS UInt8), format, array FROM t",
+     "SELECT CAST(x AS UInt8), FORMAT, ARRAY FROM t", False),
+    ("database column", "SELECT database FROM system.tables", "SELECT DATABASE FROM system.tables", False),
+]
+
+
+@pytest.mark.parametrize("name,text1,text2,expected", CORPUS, ids=[c[0] for c in CORPUS])
+def test_tokens_equal_corpus(name, text1, text2, expected):
+    assert tokens_equal(text1, text2) is expected
+
+
+def test_canonical_tokens():
+    assert canonical_tokens("select a.b, 'x''y' /* c */ FROM t") == (
+        "SELECT", "a", ".", "b", ",", "'x''y'", "FROM", "t")
+    assert canonical_tokens("SELECT x >= 1.5e3 and y::String or z <> 0x1F") == (
+        "SELECT", "x", ">=", "1.5e3", "and", "y", "::", "String", "or", "z", "<>", "0x1F")
+    assert canonical_tokens("drop table if exists t; insert into t SELECT 1") == (
+        "DROP", "TABLE", "IF", "EXISTS", "t", ";", "INSERT", "INTO", "t", "SELECT", "1")
+
+
+def test_unterminated_comment_raises():
+    with pytest.raises(TokenizeError):
+        canonical_tokens("SELECT 1 /* tail")
+
+
+def test_unterminated_literal_is_never_equal():
+    with pytest.raises(TokenizeError):
+        canonical_tokens("SELECT 'abc")
+    assert not tokens_equal("SELECT 'abc", "SELECT  'abc")
+
+
+@pytest.mark.skipif(shutil.which(clickhouse_format_command()[0]) is None, reason="clickhouse-format is not installed")
+def test_corpus_agrees_with_clickhouse_format():
+    # Пары, одинаковые по токенам, обязаны одинаково форматироваться настоящим clickhouse-format
+    total, equal, mismatches = validate(((n, t1, t2) for n, t1, t2, _ in CORPUS), format_sql_many)
+    assert total == len(CORPUS)
+    assert equal == sum(1 for *_, expected in CORPUS if expected)
+    assert mismatches == []